@@ -6,6 +6,13 @@ import os
 import re
 import atexit
 from dotenv import load_dotenv 
+from llm_client import post_json, stream_chat_completion, CassetteMiss
+from result_formatter import format_result
+from intent_router import route_question, get_stats as get_intent_stats
+from entity_resolver import get_resolver, DriverGraph
+from query_guard import run_guarded, QueryRejected
+from result_paging import preview_rows
+from metrics import trace, timed, record_tokens, record_rows
 
 load_dotenv()
 
@@ -15,12 +22,39 @@ NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD")
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 GROQ_API_ENDPOINT = os.getenv("GROQ_API_ENDPOINT")
 
-driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASSWORD))
+# History is capped so session state and rerun cost stay constant over long sessions
+MAX_HISTORY_MESSAGES = 60
+HISTORY_RENDER_WINDOW = 12
+RAW_PREVIEW_ROWS = 20
+
+# One driver per process; Streamlit reruns this script on every interaction
+@st.cache_resource
+def get_driver():
+    driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASSWORD))
+    atexit.register(driver.close)
+    return driver
 
 # Initialize chat history
 if "chat_history" not in st.session_state:
     st.session_state["chat_history"] = []
 
+def add_message(role, content, details=None):
+    message = {"role": role, "content": content}
+    if details is not None:
+        message["details"] = details
+    history = st.session_state["chat_history"]
+    history.append(message)
+    del history[:-MAX_HISTORY_MESSAGES]
+
+def render_message(message):
+    if message["role"] == "user":
+        st.write(f"**You:** {message['content']}")
+    else:
+        st.write(f"**Bot:** {message['content']}")
+    if message.get("details"):
+        with st.expander("Details"):
+            st.text(message["details"])
+
 # Extract Cypher query
 def extract_cypher_query(response_content):
     try:
@@ -37,11 +71,6 @@ def extract_cypher_query(response_content):
 
 # Generate Cypher query
 def generate_cypher_query(user_query):
-    endpoint = GROQ_API_ENDPOINT
-    headers = {
-        "Authorization": f"Bearer {GROQ_API_KEY}",
-        "Content-Type": "application/json",
-    }
     payload = {
         "model": "llama3-8b-8192",
         "messages": [
@@ -91,40 +120,44 @@ def generate_cypher_query(user_query):
         "temperature": 0.0
     }
     try:
-        response = requests.post(endpoint, headers=headers, json=payload)
-        response.raise_for_status()
-        response_data = response.json()
-        st.write("Groq API Response:", response_data)
+        with timed("generate_cypher"):
+            response_data = post_json(payload, kind="chat")
+        record_tokens("generate_cypher", response_data.get("usage"))
         cypher_query = extract_cypher_query(response_data["choices"][0]["message"]["content"])
         return cypher_query
     except requests.exceptions.RequestException as e:
         st.error(f"Error communicating with Groq API: {str(e)}")
         return ""
+    except CassetteMiss as e:
+        st.error(str(e))
+        return ""
 
-def query_neo4j(cypher_query):
-    if not cypher_query.strip().startswith("MATCH"):
-        st.error("Invalid Cypher query. Query must start with 'MATCH'.")
+def query_neo4j(cypher_query, params=None):
+    if not cypher_query.strip():
+        st.error("No Cypher query to run.")
         return []
     try:
-        with driver.session() as session:
-            results = session.run(cypher_query)
-            return [record.data() for record in results]
+        # LIMIT cap, EXPLAIN cost check and transaction timeout before anything runs
+        with timed("graph_query"):
+            rows = run_guarded(get_driver(), cypher_query, params)
+        record_rows("graph_query", len(rows))
+        return rows
+    except QueryRejected as e:
+        st.error(f"Cypher query rejected: {str(e)}")
+        return []
     except Exception as e:
         st.error(f"Error executing Cypher query: {str(e)}")
         return []
 
+FORMATTER_SYSTEM_PROMPT = "You are a data formatter. Convert the provided data into natural language format."
+
 def format_human_readable(data):
-    endpoint = GROQ_API_ENDPOINT
-    headers = {
-        "Authorization": f"Bearer {GROQ_API_KEY}",
-        "Content-Type": "application/json",
-    }
     payload = {
         "model": "llama3-8b-8192",
         "messages": [
             {
                 "role": "system",
-                "content": "You are a data formatter. Convert the provided data into natural language format."
+                "content": FORMATTER_SYSTEM_PROMPT
             },
             {
                 "role": "user",
@@ -133,13 +166,32 @@ def format_human_readable(data):
         ]
     }
     try:
-        response = requests.post(endpoint, headers=headers, json=payload)
-        response.raise_for_status()
-        response_data = response.json()
+        with timed("format_answer"):
+            response_data = post_json(payload, kind="chat")
+        record_tokens("format_answer", response_data.get("usage"))
         return response_data["choices"][0]["message"]["content"]
     except requests.exceptions.RequestException as e:
         st.error(f"Error communicating with Groq API: {str(e)}")
         return "Error generating response."
+    except CassetteMiss as e:
+        st.error(str(e))
+        return "Error generating response."
+
+# Streamed variant of format_human_readable, yields tokens as Groq generates them
+def format_human_readable_stream(data):
+    messages = [
+        {"role": "system", "content": FORMATTER_SYSTEM_PROMPT},
+        {"role": "user", "content": json.dumps(data)}
+    ]
+    try:
+        with timed("format_answer_stream"):
+            yield from stream_chat_completion(messages)
+    except requests.exceptions.RequestException as e:
+        st.error(f"Error communicating with Groq API: {str(e)}")
+        yield "Error generating response."
+    except CassetteMiss as e:
+        st.error(str(e))
+        yield "Error generating response."
 
 # Streamlit App
 st.title("LLM-Based Automotive Data Insight Engine")
@@ -156,28 +208,67 @@ st.sidebar.json({
     ]
 })
 
-user_query = st.text_input("Enter your query:")
+stream_answer = st.sidebar.checkbox("Stream answer", value=True)
+intent_stats = get_intent_stats()
+st.sidebar.caption(f"Intent fast path: {intent_stats['hits']} hits, {intent_stats['misses']} misses ({intent_stats['hit_rate']:.0%} hit rate)")
 
-if user_query:
-    st.session_state["chat_history"].append({"role": "user", "content": user_query})
+# A form only reruns the pipeline on submit, not on every other widget interaction
+with st.form("query_form", clear_on_submit=True):
+    user_query = st.text_input("Enter your query:")
+    submitted = st.form_submit_button("Ask")
+
+if submitted and user_query:
+    # Per-stage timings for this query, shown in the breakdown panel below
+    with trace() as query_timings:
+        add_message("user", user_query)
     
-    with st.spinner("Converting your query into a Cypher query..."):
-        cypher_query = generate_cypher_query(user_query)
-        st.session_state["chat_history"].append({"role": "bot", "content": f"Generated Cypher Query: `{cypher_query}`"})
+        # Recognized intents compile straight to a parameterized query; everything else goes to the LLM
+        with timed("intent_route"):
+            # Intent slots are checked against the entity name index, reloaded when the graph version changes
+            try:
+                get_resolver().maybe_refresh(DriverGraph(get_driver()))
+            except Exception as e:
+                print(f"Error refreshing the entity name index: {e}")
+            intent_match = route_question(user_query)
+        if intent_match:
+            cypher_query, query_params = intent_match["query"], intent_match["params"]
+            add_message("bot", f"Matched intent `{intent_match['intent']}` with parameters `{query_params}`")
+        else:
+            with st.spinner("Converting your query into a Cypher query..."):
+                cypher_query, query_params = generate_cypher_query(user_query), {}
+                add_message("bot", f"Generated Cypher Query: `{cypher_query}`")
     
-    with st.spinner("Fetching data from the knowledge graph..."):
-        neo4j_data = query_neo4j(cypher_query)
-        st.session_state["chat_history"].append({"role": "bot", "content": f"Raw Data: {neo4j_data}"})
+        with st.spinner("Fetching data from the knowledge graph..."):
+            neo4j_data = query_neo4j(cypher_query, query_params)
+            add_message("bot", f"Raw Data: {len(neo4j_data)} rows", details=preview_rows(neo4j_data, RAW_PREVIEW_ROWS))
     
-    with st.spinner("Formatting data for human readability..."):
-        human_readable_response = format_human_readable(neo4j_data)
-        st.session_state["chat_history"].append({"role": "bot", "content": human_readable_response})
+        # Common result shapes are rendered locally; only irregular ones need the second LLM round-trip
+        with timed("format_template"):
+            templated_response = format_result(neo4j_data)
+        if templated_response is not None:
+            add_message("bot", templated_response)
+        elif stream_answer:
+            # Render tokens as they arrive; the placeholder is cleared once the answer is in the history below
+            placeholder = st.empty()
+            with placeholder.container():
+                human_readable_response = st.write_stream(format_human_readable_stream(neo4j_data))
+            placeholder.empty()
+            add_message("bot", human_readable_response)
+        else:
+            with st.spinner("Formatting data for human readability..."):
+                human_readable_response = format_human_readable(neo4j_data)
+                add_message("bot", human_readable_response)
+    st.session_state["last_timings"] = query_timings
 
-# Display chat history
-for message in st.session_state["chat_history"]:
-    if message["role"] == "user":
-        st.write(f"**You:** {message['content']}")
-    else:
-        st.write(f"**Bot:** {message['content']}")
+if st.session_state.get("last_timings"):
+    with st.expander("Timing breakdown of the last query"):
+        st.table(st.session_state["last_timings"])
 
-atexit.register(driver.close)
\ No newline at end of file
+# Display chat history; only the latest messages are rendered unless older ones are asked for
+history = st.session_state["chat_history"]
+older_messages, recent_messages = history[:-HISTORY_RENDER_WINDOW], history[-HISTORY_RENDER_WINDOW:]
+if older_messages and st.checkbox(f"Show {len(older_messages)} earlier messages"):
+    for message in older_messages:
+        render_message(message)
+for message in recent_messages:
+    render_message(message)
\ No newline at end of file
@@ -0,0 +1,151 @@
+import bisect
+import difflib
+import re
+import threading
+import time
+from metrics import record_cache
+
+FULLTEXT_INDEX_NAME = "entity_names"
+REFRESH_INTERVAL_SECONDS = 60
+FUZZY_CUTOFF = 0.85
+# Prefix/substring matches need a specific enough entity: "car" would otherwise match "Carens"
+MIN_PARTIAL_LENGTH = 4
+GENERIC_WORDS = {
+    "car", "cars", "vehicle", "vehicles", "model", "models", "variant", "variants", "brand", "brands",
+    "the", "a", "an", "this", "that", "it", "one", "cheapest", "lowest", "highest", "best", "top", "base",
+}
+
+NAMES_QUERY = """
+MATCH (n)
+WHERE n:Brand OR n:Model OR n:Variant
+RETURN n.name AS name, labels(n)[0] AS type
+"""
+
+VERSION_QUERY = "MATCH (g:GraphMeta {name: 'catalog'}) RETURN g.version AS version"
+
+# One round-trip for every entity the in-process index could not resolve
+FULLTEXT_QUERY = f"""
+UNWIND $entities AS entity
+CALL db.index.fulltext.queryNodes('{FULLTEXT_INDEX_NAME}', entity.search) YIELD node, score
+WITH entity, node, score
+ORDER BY score DESC
+WITH entity, collect(node)[0] AS node
+RETURN entity.name AS entity, node.name AS result, labels(node)[0] AS type
+"""
+
+LUCENE_SPECIAL_CHARS = re.compile(r'([+\-!(){}\[\]^"~*?:\\/]|&&|\|\|)')
+
+def escape_lucene(text):
+    return LUCENE_SPECIAL_CHARS.sub(r"\\\1", text)
+
+# Prefix/substring/fuzzy index over Brand, Model and Variant names, refreshed when the graph version changes
+class EntityResolver:
+    def __init__(self, refresh_interval=REFRESH_INTERVAL_SECONDS):
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._version = None
+        self._checked_at = 0.0
+        self._by_name = {}
+        self._sorted_names = []
+        self._fulltext_available = True
+
+    def graph_version(self, graph):
+        rows = graph.query(VERSION_QUERY)
+        return rows[0]["version"] if rows else None
+
+    def load(self, graph):
+        version = self.graph_version(graph)
+        by_name = {}
+        for row in graph.query(NAMES_QUERY):
+            if row["name"]:
+                by_name.setdefault(row["name"].lower(), (row["name"], row["type"]))
+        with self._lock:
+            self._by_name = by_name
+            self._sorted_names = sorted(by_name)
+            self._version = version
+            self._checked_at = time.monotonic()
+            # A reload may come after the loader created the full-text index, so try it again
+            self._fulltext_available = True
+
+    def maybe_refresh(self, graph):
+        if self._checked_at and time.monotonic() - self._checked_at < self.refresh_interval:
+            return
+        self._checked_at = time.monotonic()
+        # Without a GraphMeta version marker the names are simply reloaded every interval
+        version = self.graph_version(graph)
+        if not self._sorted_names or version is None or version != self._version:
+            self.load(graph)
+
+    def is_loaded(self):
+        return bool(self._sorted_names)
+
+    def lookup_local(self, entity):
+        key = entity.strip().lower()
+        if not key:
+            return None
+        with self._lock:
+            by_name, names = self._by_name, self._sorted_names
+        if key in by_name:
+            return by_name[key]
+        if len(key) < MIN_PARTIAL_LENGTH or GENERIC_WORDS.issuperset(key.split()):
+            return None
+
+        # Shortest name starting with the entity, then shortest containing it (the old CONTAINS semantics)
+        start = bisect.bisect_left(names, key)
+        prefixed = []
+        for name in names[start:]:
+            if not name.startswith(key):
+                break
+            prefixed.append(name)
+        if prefixed:
+            return by_name[min(prefixed, key=len)]
+        containing = [name for name in names if key in name]
+        if containing:
+            return by_name[min(containing, key=len)]
+
+        close = difflib.get_close_matches(key, names, n=1, cutoff=FUZZY_CUTOFF)
+        return by_name[close[0]] if close else None
+
+    # Map each entity to (name, type); entities missing locally go to the full-text index in one query
+    def resolve(self, graph, entities):
+        self.maybe_refresh(graph)
+        resolved, misses = {}, []
+        for entity in entities:
+            match = self.lookup_local(entity)
+            record_cache("entity_index", match is not None)
+            if match:
+                resolved[entity] = match
+            elif entity.strip():
+                misses.append({"name": entity, "search": escape_lucene(entity.strip())})
+
+        if misses and self._fulltext_available:
+            try:
+                rows = graph.query(FULLTEXT_QUERY, {"entities": misses})
+            except Exception as e:
+                # Graphs loaded before the index existed: leave these entities unresolved instead of failing
+                print(f"Full-text index '{FULLTEXT_INDEX_NAME}' unavailable, run knowledge_graph_creation.py to create it: {e}")
+                self._fulltext_available = False
+                rows = []
+            for row in rows:
+                if row["result"]:
+                    resolved[row["entity"]] = (row["result"], row["type"])
+        return resolved
+
+# graph.query() over a bare neo4j driver, for apps that don't use Neo4jGraph
+class DriverGraph:
+    def __init__(self, driver):
+        self.driver = driver
+
+    def query(self, cypher_query, params=None):
+        with self.driver.session() as session:
+            return session.run(cypher_query, params or {}).data()
+
+_resolver = None
+_resolver_lock = threading.Lock()
+
+def get_resolver():
+    global _resolver
+    with _resolver_lock:
+        if _resolver is None:
+            _resolver = EntityResolver()
+        return _resolver
@@ -0,0 +1,177 @@
+import json
+import os
+import threading
+import time
+import numpy as np
+from dotenv import load_dotenv
+from spec_data import fetch_variant_specs, flatten_specs, feature_flag
+
+load_dotenv()
+
+FEATURE_GAPS_PATH = os.getenv("FEATURE_GAPS_PATH", "feature_gaps.json")
+TARGET_BRAND = os.getenv("FEATURE_GAPS_BRAND", "volkswagen").strip().lower()
+
+# Segment price bands in rupees (ex-showroom)
+PRICE_BANDS = [
+    (0, 5e5, "under ₹5 Lakh"),
+    (5e5, 1e6, "₹5-10 Lakh"),
+    (1e6, 1.5e6, "₹10-15 Lakh"),
+    (1.5e6, 2e6, "₹15-20 Lakh"),
+    (2e6, 3e6, "₹20-30 Lakh"),
+    (3e6, 5e6, "₹30-50 Lakh"),
+    (5e6, 1e7, "₹50 Lakh-1 Crore"),
+    (1e7, float("inf"), "over ₹1 Crore"),
+]
+
+# A feature is a gap when at least this share of peer models offers it, an advantage when at most this share does
+GAP_THRESHOLD = 0.5
+ADVANTAGE_THRESHOLD = 0.25
+
+def price_band(price):
+    if price is None:
+        return "price unknown"
+    for low, high, label in PRICE_BANDS:
+        if low <= price < high:
+            return label
+    return "price unknown"
+
+def segment_key(body_type, band):
+    return f"{body_type}|{band}"
+
+# Yes/no features of each variant; other spec values (numbers, text) are not features
+def variant_features(variant):
+    flags = {}
+    for key, value in flatten_specs(variant["specs"]).items():
+        flag = feature_flag(value)
+        if flag is not None:
+            flags[key] = flag
+    return flags
+
+# Variant-by-feature matrix for one segment: 1 = has it, 0 = lacks it, -1 = not listed
+def build_segment_matrix(variants):
+    flags = [variant_features(variant) for variant in variants]
+    features = sorted({key for variant_flags in flags for key in variant_flags})
+    column = {feature: i for i, feature in enumerate(features)}
+    matrix = np.full((len(variants), len(features)), -1, dtype=np.int8)
+    for row, variant_flags in enumerate(flags):
+        for feature, flag in variant_flags.items():
+            matrix[row, column[feature]] = 1 if flag else 0
+    return features, matrix
+
+# Collapse variants to models: a model offers a feature if any variant does
+def model_matrix(models, variant_models, matrix):
+    offered = np.zeros((len(models), matrix.shape[1]), dtype=bool)
+    listed = np.zeros_like(offered)
+    index = {model: i for i, model in enumerate(models)}
+    rows = np.array([index[model] for model in variant_models])
+    np.logical_or.at(offered, rows, matrix == 1)
+    np.logical_or.at(listed, rows, matrix >= 0)
+    return offered, listed
+
+def segment_gaps(segment, models, brands, offered, listed, features):
+    is_target = np.array([TARGET_BRAND in brands[model].lower() for model in models])
+    if not is_target.any():
+        return {}
+    peers = ~is_target
+    if not peers.any():
+        return {}
+
+    # Share of peer models offering each feature, among peers that list it at all
+    peer_listed = listed[peers].sum(axis=0)
+    peer_offered = offered[peers].sum(axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        peer_share = np.where(peer_listed > 0, peer_offered / np.maximum(peer_listed, 1), 0.0)
+    peer_models = [model for model, peer in zip(models, peers) if peer]
+
+    gaps = {}
+    for i in np.flatnonzero(is_target):
+        missing = np.flatnonzero(~offered[i] & (peer_share >= GAP_THRESHOLD))
+        advantages = np.flatnonzero(offered[i] & (peer_share <= ADVANTAGE_THRESHOLD))
+        gaps[models[i]] = {
+            "segment": segment,
+            "peers": peer_models,
+            "missing": [
+                {
+                    "feature": features[j],
+                    "peer_share": round(float(peer_share[j]), 2),
+                    "peers_with": [model for model, peer, has in zip(models, peers, offered[:, j]) if peer and has],
+                }
+                for j in sorted(missing, key=lambda j: -peer_share[j])
+            ],
+            "advantages": [
+                {"feature": features[j], "peer_share": round(float(peer_share[j]), 2)}
+                for j in sorted(advantages, key=lambda j: peer_share[j])
+            ],
+        }
+    return gaps
+
+# Build per-segment matrices and gap summaries from the variants in the graph
+def compute_feature_gaps(variants):
+    segments = {}
+    for variant in variants:
+        key = segment_key(variant["body_type"], price_band(variant["price"]))
+        segments.setdefault(key, []).append(variant)
+
+    result = {"segments": {}, "gaps": {}}
+    for key, segment_variants in sorted(segments.items()):
+        body_type, band = key.split("|", 1)
+        features, matrix = build_segment_matrix(segment_variants)
+        variant_models = [variant["model"] for variant in segment_variants]
+        models = sorted(set(variant_models))
+        brands = {variant["model"]: variant["brand"] for variant in segment_variants}
+        offered, listed = model_matrix(models, variant_models, matrix)
+
+        result["segments"][key] = {
+            "body_type": body_type,
+            "price_band": band,
+            "variants": [variant["variant"] for variant in segment_variants],
+            "models": variant_models,
+            "features": features,
+            "matrix": matrix.tolist(),
+        }
+        for model, gap in segment_gaps(key, models, brands, offered, listed, features).items():
+            result["gaps"].setdefault(model, []).append(gap)
+    return result
+
+def save_feature_gaps(result, path=FEATURE_GAPS_PATH):
+    # Save to a temporary file first so the API never reads a half-written file
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False)
+    os.replace(temp_path, path)
+
+# Precompute job, run after knowledge_graph_creation.py has loaded the graph
+def build_feature_gaps(graph, path=FEATURE_GAPS_PATH):
+    started = time.perf_counter()
+    result = compute_feature_gaps(fetch_variant_specs(graph))
+    result["generated_at"] = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+    save_feature_gaps(result, path)
+    print(f"Feature gaps for {len(result['gaps'])} models in {len(result['segments'])} segments "
+          f"written to {path} in {time.perf_counter() - started:.1f}s")
+    return result
+
+_cache = {"mtime": None, "data": None}
+_cache_lock = threading.Lock()
+
+# Precomputed gaps, reloaded only when the file changes
+def load_feature_gaps(path=FEATURE_GAPS_PATH):
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    with _cache_lock:
+        if _cache["mtime"] != mtime:
+            with open(path, encoding="utf-8") as f:
+                _cache["data"] = json.load(f)
+            _cache["mtime"] = mtime
+        return _cache["data"]
+
+def find_model_gaps(gaps, model_name):
+    model_name = model_name.strip().lower()
+    return {model: entries for model, entries in gaps["gaps"].items() if model_name in model.lower()}
+
+if __name__ == "__main__":
+    from langchain_community.graphs import Neo4jGraph
+
+    graph = Neo4jGraph(url=os.getenv("NEO4J_URI"), username=os.getenv("NEO4J_USERNAME"), password=os.getenv("NEO4J_PASSWORD"))
+    build_feature_gaps(graph)
@@ -1,10 +1,22 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
 from dotenv import load_dotenv
 import os
-import requests
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from neo4j import GraphDatabase
-from langchain_community.graphs import Neo4jGraph
+from llm_client import post_json, stream_chat_completion, CassetteMiss
+from result_formatter import format_result
+from intent_router import route_question, normalize_question, get_stats as get_intent_stats
+from query_guard import run_guarded_page, QueryRejected
+from result_paging import clamp_page_size, encode_cursor, decode_cursor, InvalidCursor
+from singleflight import SingleFlight
+from entity_resolver import get_resolver
+from metrics import trace, timed, record_tokens, record_rows, record_cache, render_prometheus
+from knowledge_graph_creation import convert_price_to_number
+from spec_data import get_spec_sheets
 
 load_dotenv()
 
@@ -17,76 +29,361 @@ NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD")
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 GROQ_API_ENDPOINT = os.getenv("GROQ_API_ENDPOINT")
 
-# Connect to Neo4j
+BATCH_MAX_WORKERS = int(os.getenv("BATCH_MAX_WORKERS", "8"))
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "50"))
+SPEC_SHEETS_MAX_VARIANTS = 20
+
+# Bounded pool for batch questions, and in-flight dedup shared by /ask and /ask/batch;
+# both are per process, so under gunicorn identical questions are only coalesced within one worker
+batch_pool = ThreadPoolExecutor(max_workers=BATCH_MAX_WORKERS)
+inflight_questions = SingleFlight()
+
+_driver = None
+_driver_lock = threading.Lock()
+_graph = None
+_graph_lock = threading.Lock()
+_schema = None
+
+# Shared driver used to execute generated queries through the guard
+def get_driver():
+    global _driver
+    with _driver_lock:
+        if _driver is None:
+            _driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USERNAME, NEO4J_PASSWORD))
+        return _driver
+
+# Connect to Neo4j once per process; the schema is read separately as a snapshot, not on every connect
 def connect_to_neo4j():
-    try:
-        return Neo4jGraph(url=NEO4J_URI, username=NEO4J_USERNAME, password=NEO4J_PASSWORD)
-    except Exception as e:
-        print(f"Error connecting to Neo4j: {e}")
-        return None
+    global _graph
+    with _graph_lock:
+        if _graph is None:
+            # langchain_community is slow to import, so it is only loaded when a graph is first needed
+            from langchain_community.graphs import Neo4jGraph
+            try:
+                _graph = Neo4jGraph(url=NEO4J_URI, username=NEO4J_USERNAME, password=NEO4J_PASSWORD, refresh_schema=False)
+            except Exception as e:
+                print(f"Error connecting to Neo4j: {e}")
+                return None
+        return _graph
+
+# Graph schema read once and reused by every generated query; a preloading server takes it before forking
+def get_schema_snapshot():
+    global _schema
+    if _schema is None:
+        graph = connect_to_neo4j()
+        if not graph:
+            return None
+        try:
+            graph.refresh_schema()
+        except Exception as e:
+            print(f"Error reading graph schema: {e}")
+            return None
+        _schema = graph.schema
+    return _schema
+
+# Connections must not be shared across fork; the master closes its own before forking workers
+def close_connections():
+    global _driver, _graph
+    with _driver_lock, _graph_lock:
+        # Neo4jGraph has no close() of its own; its driver is kept in _driver
+        for driver in (_driver, getattr(_graph, "_driver", None)):
+            if driver is not None:
+                driver.close()
+        _driver = _graph = None
+
+# Forked workers drop the references inherited from the master and open their own pools on first use
+def reset_after_fork():
+    global _driver, _graph, _driver_lock, _graph_lock
+    _driver = _graph = None
+    _driver_lock, _graph_lock = threading.Lock(), threading.Lock()
 
 # Query Groq API
 def query_groq(prompt):
     try:
-        headers = {
-            "Authorization": f"Bearer {GROQ_API_KEY}",
-            "Content-Type": "application/json",
-        }
         payload = {"prompt": prompt}
-        response = requests.post(GROQ_API_ENDPOINT, headers=headers, json=payload)
-
-        if response.status_code == 200:
-            return response.json().get("text", "")
-        else:
-            raise Exception(f"Error from Groq API: {response.status_code} {response.text}")
+        with timed("generate_cypher"):
+            response_data = post_json(payload)
+        record_tokens("generate_cypher", response_data.get("usage"))
+        return response_data.get("text", "")
+    except CassetteMiss:
+        # Replay misses go back to the client as-is rather than as a generic failure
+        raise
     except Exception as e:
         print(f"Error querying Groq API: {e}")
         return None
 
 def generate_cypher_query(graph, question):
     try:
-        schema = graph.get_schema()
+        schema = get_schema_snapshot()
         prompt = f"""
             Based on the Neo4j graph schema below, write a Cypher query that would answer the user's question:
             Schema: {schema}
             Question: {question}
             Cypher query:"""
         return query_groq(prompt)
+    except CassetteMiss:
+        raise
     except Exception as e:
         print(f"Error generating Cypher query: {e}")
         return None
 
+# Recognized intents compile to parameterized Cypher; only misses pay for the LLM round-trip
+def resolve_cypher_query(graph, question):
+    with timed("intent_route"):
+        # Intent slots are checked against the entity name index, reloaded when the graph version changes
+        try:
+            get_resolver().maybe_refresh(graph)
+        except Exception as e:
+            print(f"Error refreshing the entity name index: {e}")
+        intent_match = route_question(question)
+    if intent_match:
+        return intent_match["intent"], intent_match["query"], intent_match["params"]
+    return None, generate_cypher_query(graph, question), {}
+
+# Run one page of a query and attach the cursor for the next one
+def run_page(cypher_query, params, offset, page_size):
+    with timed("graph_query"):
+        result, has_more = run_guarded_page(get_driver(), cypher_query, params, offset, page_size)
+    record_rows("graph_query", len(result))
+    next_cursor = encode_cursor(cypher_query, params, offset + len(result)) if has_more else None
+    return {"query": cypher_query, "result": result, "page_size": page_size, "next_cursor": next_cursor}
+
 # Main function
-def handle_query(question):
+def handle_query(question, page_size):
     graph = connect_to_neo4j()
     if not graph:
         return "Failed to connect to Neo4j."
 
-    cypher_query = generate_cypher_query(graph, question)
+    try:
+        intent, cypher_query, params = resolve_cypher_query(graph, question)
+    except CassetteMiss as e:
+        return str(e)
     if not cypher_query:
         return "Failed to generate Cypher query."
 
     try:
-        result = graph.query(cypher_query)
-        return {"query": cypher_query, "result": result}
+        return {"intent": intent, **run_page(cypher_query, params, 0, page_size)}
+    except QueryRejected as e:
+        print(f"Cypher query rejected: {e}")
+        return f"Cypher query rejected: {e}"
     except Exception as e:
         print(f"Error executing Cypher query: {e}")
         return "Error executing Cypher query."
 
+# Format a server-sent event
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+# Identical questions asked concurrently share one LLM call and one graph query
+def answer_question(question, page_size):
+    key = (normalize_question(question), page_size)
+    answer, shared = inflight_questions.do(key, lambda: traced_handle_query(question, page_size))
+    record_cache("inflight_dedup", shared)
+    return answer, shared
+
+# handle_query with its per-stage timing breakdown attached to the answer
+def traced_handle_query(question, page_size):
+    with trace() as timings:
+        answer = handle_query(question, page_size)
+    if isinstance(answer, dict):
+        answer = {**answer, "timings": timings}
+    return answer
+
+def timed_answer(question, page_size):
+    started = time.perf_counter()
+    try:
+        answer, shared = answer_question(question, page_size)
+    except Exception as e:
+        print(f"Error answering batch question: {e}")
+        answer, shared = "Error answering question.", False
+    elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+    return {"query": question, "answer": answer, "shared": shared, "elapsed_ms": elapsed_ms}
+
+# Later pages skip the LLM entirely: the cursor already carries the query
+def fetch_page(cursor, page_size):
+    cypher_query, params, offset = decode_cursor(cursor)
+    try:
+        return run_page(cypher_query, params, offset, page_size)
+    except Exception as e:
+        print(f"Error executing Cypher query: {e}")
+        return "Error executing Cypher query."
+
+# Streamed variant of handle_query: emits the query and result, then the answer token by token
+def stream_query(question, page_size):
+    graph = connect_to_neo4j()
+    if not graph:
+        yield sse_event("error", {"error": "Failed to connect to Neo4j."})
+        return
+
+    try:
+        intent, cypher_query, params = resolve_cypher_query(graph, question)
+    except CassetteMiss as e:
+        yield sse_event("error", {"error": str(e)})
+        return
+    if not cypher_query:
+        yield sse_event("error", {"error": "Failed to generate Cypher query."})
+        return
+    yield sse_event("query", {"query": cypher_query, "intent": intent})
+
+    try:
+        page = run_page(cypher_query, params, 0, page_size)
+        result = page["result"]
+    except QueryRejected as e:
+        yield sse_event("error", {"error": f"Cypher query rejected: {e}"})
+        return
+    except Exception as e:
+        print(f"Error executing Cypher query: {e}")
+        yield sse_event("error", {"error": "Error executing Cypher query."})
+        return
+    yield sse_event("result", {"result": result, "next_cursor": page["next_cursor"]})
+
+    with timed("format_template"):
+        templated_answer = format_result(result)
+    if templated_answer is not None:
+        yield sse_event("token", {"token": templated_answer})
+        yield sse_event("done", {})
+        return
+
+    messages = [
+        {"role": "system", "content": "You are a data formatter. Convert the provided data into natural language format."},
+        {"role": "user", "content": json.dumps(result, default=str)}
+    ]
+    try:
+        with timed("format_answer_stream"):
+            for token in stream_chat_completion(messages):
+                yield sse_event("token", {"token": token})
+    except CassetteMiss as e:
+        yield sse_event("error", {"error": str(e)})
+        return
+    except Exception as e:
+        print(f"Error streaming answer from Groq API: {e}")
+        yield sse_event("error", {"error": "Error generating response."})
+        return
+    yield sse_event("done", {})
+
 # Flask routes
 @app.route('/', methods=['GET'])
 def home():
     return jsonify({"message": "Flask server is running!"})
 
+# Prometheus scrape endpoint; under gunicorn the series are summed across workers
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(render_prometheus(), mimetype="text/plain; version=0.0.4")
+
+# Router hit rates of the worker that served the request
+@app.route('/stats/intents', methods=['GET'])
+def intent_stats():
+    return jsonify({**get_intent_stats(), "pid": os.getpid()})
+
+# Competitor feature gaps precomputed by feature_gaps.py after each graph load
+@app.route('/insights/feature-gaps', methods=['GET'])
+def feature_gaps():
+    from feature_gaps import load_feature_gaps, find_model_gaps
+    gaps = load_feature_gaps()
+    if gaps is None:
+        return jsonify({"error": "Feature gaps have not been computed yet. Run feature_gaps.py after loading the graph."}), 503
+
+    model = request.args.get("model")
+    if not model:
+        return jsonify({"generated_at": gaps.get("generated_at"), "models": sorted(gaps["gaps"])})
+    matches = find_model_gaps(gaps, model)
+    if not matches:
+        return jsonify({"error": f"No feature gaps found for model '{model}'"}), 404
+    return jsonify({"generated_at": gaps.get("generated_at"), "gaps": matches})
+
+# Full spec sheets for up to SPEC_SHEETS_MAX_VARIANTS variants, e.g. ?names=Virtus GT,Slavia Style
+@app.route('/variants/specs', methods=['GET'])
+def variant_specs():
+    names = [name.strip() for name in request.args.get("names", "").split(",") if name.strip()]
+    if not names:
+        return jsonify({"error": "names is required"}), 400
+    if len(names) > SPEC_SHEETS_MAX_VARIANTS:
+        return jsonify({"error": f"At most {SPEC_SHEETS_MAX_VARIANTS} variants per request"}), 400
+
+    graph = connect_to_neo4j()
+    if not graph:
+        return jsonify({"error": "Failed to connect to Neo4j."}), 503
+    try:
+        sheets = get_spec_sheets(graph, names)
+    except Exception as e:
+        print(f"Error fetching spec sheets: {e}")
+        return jsonify({"error": "Error fetching spec sheets."}), 503
+    return jsonify({"variants": sheets, "missing": [name for name in names if name not in sheets]})
+
+# "Cars like X under budget": nearest neighbours in the spec-vector index built by similarity_index.py
+@app.route('/similar', methods=['GET'])
+def similar():
+    # NumPy is only imported by the workers that serve similarity queries
+    from similarity_index import get_similarity_index, DEFAULT_TOP_K, MAX_TOP_K
+    index = get_similarity_index()
+    if index is None:
+        return jsonify({"error": "Similarity index has not been built yet. Run similarity_index.py after loading the graph."}), 503
+
+    name = request.args.get("name", "").strip()
+    if not name:
+        return jsonify({"error": "name is required"}), 400
+    max_price = request.args.get("max_price")
+    if max_price:
+        max_price = convert_price_to_number(max_price)
+        if max_price is None:
+            return jsonify({"error": "max_price must be an amount such as 1500000 or 15 lakh"}), 400
+    try:
+        k = min(max(int(request.args.get("k", DEFAULT_TOP_K)), 1), MAX_TOP_K)
+    except ValueError:
+        return jsonify({"error": "k must be a number"}), 400
+
+    result = index.similar_to(
+        name,
+        k=k,
+        max_price=max_price or None,
+        fuel=request.args.get("fuel"),
+        cheaper=request.args.get("cheaper", "").lower() in ("1", "true", "yes"),
+    )
+    if result is None:
+        return jsonify({"error": f"No variant or model named '{name}'"}), 404
+    return jsonify(result)
+
 @app.route('/ask', methods=['POST'])
 def ask():
     data = request.json
+    page_size = clamp_page_size(data.get("page_size"))
+    if data.get("cursor"):
+        try:
+            return jsonify({"answer": fetch_page(data["cursor"], page_size)})
+        except InvalidCursor as e:
+            return jsonify({"error": str(e)}), 400
+
     question = data.get("query")
     if not question:
         return jsonify({"error": "Query is required"}), 400
 
-    response = handle_query(question)
+    # Server-sent events when asked for, so clients see the first token instead of waiting for the full answer
+    if data.get("stream") or request.accept_mimetypes.best == "text/event-stream":
+        return Response(
+            stream_with_context(stream_query(question, page_size)),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    response, _ = answer_question(question, page_size)
     return jsonify({"answer": response})
 
+@app.route('/ask/batch', methods=['POST'])
+def ask_batch():
+    data = request.json
+    questions = data.get("queries")
+    if not isinstance(questions, list) or not questions or not all(isinstance(q, str) and q.strip() for q in questions):
+        return jsonify({"error": "queries must be a non-empty list of questions"}), 400
+    if len(questions) > BATCH_MAX_QUESTIONS:
+        return jsonify({"error": f"At most {BATCH_MAX_QUESTIONS} queries per batch"}), 400
+
+    page_size = clamp_page_size(data.get("page_size"))
+    started = time.perf_counter()
+    futures = [batch_pool.submit(timed_answer, question, page_size) for question in questions]
+    results = [future.result() for future in futures]
+    elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+    return jsonify({"results": results, "elapsed_ms": elapsed_ms})
+
 if __name__ == "__main__":
     app.run(host='0.0.0.0', port=5000)
\ No newline at end of file
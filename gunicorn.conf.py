@@ -0,0 +1,24 @@
+import os
+import multiprocessing
+import tempfile
+
+# Usage: gunicorn -c gunicorn.conf.py serve:app
+
+bind = os.getenv("BIND", "0.0.0.0:5000")
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+# Threads keep streamed (/ask with stream) answers from tying up a whole worker
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+
+# Load the app once in the master so workers fork already warm. Intent stats and in-flight
+# question dedup are not shared between workers (see the Serving section of the README)
+preload_app = True
+
+# Workers write their metrics here so /metrics reports the whole server, whichever worker answers
+os.environ.setdefault("METRICS_MULTIPROC_DIR", tempfile.mkdtemp(prefix="vwisionaries-metrics-"))
+
+# server.cfg.workers is the effective count, including a -w/--workers override on the command line
+def post_fork(server, worker):
+    import serve
+    serve.init_worker(server.cfg.workers)
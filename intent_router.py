@@ -0,0 +1,229 @@
+import re
+import threading
+from knowledge_graph_creation import convert_price_to_number
+from metrics import record_cache
+from entity_resolver import get_resolver
+
+# Prices are stored on the Price node as the ex_showroom string written by the loader
+PRICE_EXPR = "toFloat(p.ex_showroom)"
+
+FUEL_TYPES = ["petrol", "diesel", "cng", "electric", "hybrid", "lpg"]
+BODY_TYPES = {
+    "sedan": "sedan", "sedans": "sedan",
+    "suv": "suv", "suvs": "suv",
+    "hatchback": "hatchback", "hatchbacks": "hatchback",
+    "muv": "muv", "muvs": "muv",
+    "mpv": "mpv", "mpvs": "mpv",
+    "coupe": "coupe", "coupes": "coupe",
+    "convertible": "convertible", "convertibles": "convertible",
+    "pickup": "pickup", "pickups": "pickup",
+}
+
+# Parameterized Cypher for each intent; slots are always passed as parameters, never interpolated
+CYPHER_TEMPLATES = {
+    "budget_search": f"""
+        MATCH (b:Brand)-[:HAS_MODEL]->(m:Model)-[:HAS_VARIANT]->(v:Variant)-[:HAS_PRICE]->(p:Price)
+        WHERE {PRICE_EXPR} <= $max_price
+          AND ($body_type IS NULL OR toLower(m.type) CONTAINS $body_type)
+          AND ($fuel IS NULL OR any(f IN [(v)-[:HAS_FUEL]->(f:Fuel) | f]
+                                    WHERE any(k IN keys(f) WHERE toLower(toString(f[k])) CONTAINS $fuel)))
+        RETURN b.name AS brand, m.name AS model, v.name AS variant, {PRICE_EXPR} AS price
+        ORDER BY price DESC
+        LIMIT 10""",
+    "variant_price": f"""
+        MATCH (m:Model)-[:HAS_VARIANT]->(v:Variant)-[:HAS_PRICE]->(p:Price)
+        WHERE toLower(v.name) CONTAINS $name OR toLower(m.name) CONTAINS $name
+        RETURN v.name AS variant, {PRICE_EXPR} AS price
+        ORDER BY price
+        LIMIT 25""",
+    "compare_models": f"""
+        MATCH (m:Model)-[:HAS_VARIANT]->(v:Variant)-[:HAS_PRICE]->(p:Price)
+        WHERE any(name IN $models WHERE toLower(m.name) CONTAINS name)
+        RETURN m.name AS model, m.type AS type, count(v) AS variants,
+               min({PRICE_EXPR}) AS min_price, max({PRICE_EXPR}) AS max_price
+        ORDER BY model""",
+    "variants_with_feature": """
+        MATCH (m:Model)-[:HAS_VARIANT]->(v:Variant)
+        WHERE toLower(m.name) CONTAINS $model
+          AND any(s IN [(v)-->(s) | s] WHERE
+                any(k IN keys(s) WHERE toLower(k) CONTAINS $feature_key AND NOT toLower(toString(s[k])) IN ['no', 'not available'])
+                OR toLower(coalesce(s.details, '')) =~ ('.*"[^"]*' + $feature_key + '[^"]*": "(?!no")[^"]*".*')
+                OR toLower(coalesce(s.details, '')) CONTAINS ('"' + $feature + '"'))
+        RETURN m.name AS model, v.name AS variant
+        ORDER BY variant""",
+    # Spec sheets come from the denormalized spec_sheet property, not a traversal of every spec node
+    "spec_sheet": """
+        MATCH (m:Model)-[:HAS_VARIANT]->(v:Variant)
+        WHERE toLower(v.name) CONTAINS $name OR toLower(m.name) CONTAINS $name
+        RETURN v.name AS variant, v.spec_sheet AS spec_sheet
+        ORDER BY CASE WHEN toLower(v.name) = $name THEN 0 ELSE 1 END, variant
+        LIMIT 5""",
+    "compare_specs": """
+        MATCH (m:Model)-[:HAS_VARIANT]->(v:Variant)
+        WHERE any(name IN $names WHERE toLower(v.name) CONTAINS name OR toLower(m.name) CONTAINS name)
+        RETURN v.name AS variant, v.spec_sheet AS spec_sheet
+        ORDER BY variant
+        LIMIT 5""",
+}
+
+AMOUNT_PATTERN = (
+    r"(?:under|below|less than|within|upto|up to|max(?:imum)?|budget(?: of)?)\s*(?:rs\.?|inr|₹)?\s*"
+    r"(?P<amount>\d+(?:[.,]\d+)*\s*(?:lakhs?|lacs?|crores?|cr\b)?)"
+)
+# Only "[show me] [a] [petrol] [suv] [cars] under X" phrasings; anything else in the question needs the LLM
+BUDGET_PATTERN = re.compile(
+    r"^(?:(?:suggest|show|list|find|recommend|give)(?: me)? |(?:which|what) (?:are |is )?(?:the )?|i (?:want|need) )?"
+    r"(?:(?:a|an|some|any) )?(?:(?:good|best|cheap|affordable) )?"
+    rf"(?:(?P<fuel>{'|'.join(FUEL_TYPES)}) )?"
+    rf"(?:(?P<body_type>{'|'.join(BODY_TYPES)}) )?"
+    r"(?:(?:cars?|vehicles?|models?|options?) )?"
+    rf"{AMOUNT_PATTERN}(?: budget)?\??$"
+)
+# Words that make a slot an attribute or a condition rather than a model or feature name
+ATTRIBUTE_WORDS = {
+    "of", "than", "more", "less", "most", "least", "over", "under", "above", "below", "at", "which", "what", "how",
+    "mileage", "efficiency", "safety", "features", "feature", "price", "prices", "cost", "specs", "engine", "power",
+    "torque", "airbags", "boot", "space", "size", "dimensions", "interior", "performance", "variants", "rating",
+}
+SLOT_PATTERN = re.compile(r"^[a-z0-9][\w .+-]*$")
+
+PRICE_PATTERNS = [
+    re.compile(r"^(?:what is |what's )?(?:the )?(?:ex[- ]showroom )?price of (?:the )?(?P<name>[\w .+-]+?)\??$"),
+    re.compile(r"^how much (?:does|is) (?:the )?(?P<name>[\w .+-]+?)(?: cost)?\??$"),
+    re.compile(r"^(?P<name>[\w .+-]+?) (?:ex[- ]showroom )?price\??$"),
+]
+COMPARE_PATTERNS = [
+    re.compile(r"^compare (?:the )?(?P<a>[\w .+-]+?) (?:and|with|vs\.?|versus) (?:the )?(?P<b>[\w .+-]+?)\??$"),
+    re.compile(r"^(?P<a>[\w .+-]+?) (?:vs\.?|versus) (?P<b>[\w .+-]+?)\??$"),
+]
+FEATURE_PATTERNS = [
+    re.compile(r"^(?:which|what) variants? of (?:the )?(?P<model>[\w .+-]+?) (?:have|has|come with|comes with|offer|offers) (?:an? |the )?(?P<feature>[\w .+-]+?)\??$"),
+    re.compile(r"^(?P<model>[\w .+-]+?) variants? with (?:an? |the )?(?P<feature>[\w .+-]+?)\??$"),
+]
+SPEC_WORDS = r"(?:full )?(?:specs|specifications|spec sheets?|specification sheets?)"
+SPEC_PATTERNS = [
+    re.compile(rf"^(?:show (?:me )?|give me |what are )?(?:the )?{SPEC_WORDS} (?:of|for) (?:the )?(?P<name>[\w .+-]+?)\??$"),
+    re.compile(rf"^(?P<name>[\w .+-]+?) {SPEC_WORDS}\??$"),
+]
+COMPARE_SPECS_PATTERNS = [
+    re.compile(rf"^compare (?:the )?{SPEC_WORDS} of (?:the )?(?P<a>[\w .+-]+?) (?:and|with|vs\.?|versus) (?:the )?(?P<b>[\w .+-]+?)\??$"),
+    re.compile(rf"^(?P<a>[\w .+-]+?) (?:vs\.?|versus) (?P<b>[\w .+-]+?) {SPEC_WORDS}\??$"),
+]
+
+_stats_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "by_intent": {}}
+
+def normalize_question(question):
+    return re.sub(r"\s+", " ", question.strip().lower()).rstrip(".!")
+
+def _plain_slot(value):
+    return bool(SLOT_PATTERN.match(value)) and not ATTRIBUTE_WORDS.intersection(value.split())
+
+# A model/variant slot must be a plain name the entity index knows; without a loaded index the LLM decides
+def _known_name(value):
+    if not _plain_slot(value):
+        return False
+    resolver = get_resolver()
+    return resolver.is_loaded() and resolver.lookup_local(value) is not None
+
+# Feature slots must be a plain feature name; counts and comparisons ("more than 6 airbags") need the LLM
+def _plain_feature(value):
+    return bool(SLOT_PATTERN.match(value)) and not re.search(r"\d", value) \
+        and not {"than", "more", "less", "most", "least", "over", "under", "above", "below", "at"}.intersection(value.split())
+
+def _match_budget_search(question):
+    match = BUDGET_PATTERN.match(question)
+    if not match:
+        return None
+    fuel, body_type = match.group("fuel"), match.group("body_type")
+    if not fuel and not body_type:
+        return None
+    max_price = convert_price_to_number(match.group("amount"))
+    if max_price is None:
+        return None
+    return {"max_price": max_price, "fuel": fuel, "body_type": BODY_TYPES.get(body_type)}
+
+def _match_variant_price(question):
+    for pattern in PRICE_PATTERNS:
+        match = pattern.match(question)
+        if match and _known_name(match.group("name").strip()):
+            return {"name": match.group("name").strip()}
+    return None
+
+def _match_compare_models(question):
+    for pattern in COMPARE_PATTERNS:
+        match = pattern.match(question)
+        if match:
+            models = [match.group("a").strip(), match.group("b").strip()]
+            return {"models": models} if all(_known_name(model) for model in models) else None
+    return None
+
+def _match_variants_with_feature(question):
+    for pattern in FEATURE_PATTERNS:
+        match = pattern.match(question)
+        if match:
+            feature = match.group("feature").strip()
+            if not _known_name(match.group("model").strip()) or not _plain_feature(feature):
+                return None
+            return {
+                "model": match.group("model").strip(),
+                "feature": feature,
+                "feature_key": re.sub(r"[^a-z0-9_]", "_", feature),
+            }
+    return None
+
+def _match_spec_sheet(question):
+    for pattern in SPEC_PATTERNS:
+        match = pattern.match(question)
+        if match and _known_name(match.group("name").strip()):
+            return {"name": match.group("name").strip()}
+    return None
+
+def _match_compare_specs(question):
+    for pattern in COMPARE_SPECS_PATTERNS:
+        match = pattern.match(question)
+        if match:
+            names = [match.group("a").strip(), match.group("b").strip()]
+            return {"names": names} if all(_known_name(name) for name in names) else None
+    return None
+
+# Checked in order; the budget search goes first since "under X" questions can also look like price questions,
+# and spec comparisons before model comparisons since "compare specs of X and Y" matches both
+INTENT_MATCHERS = [
+    ("budget_search", _match_budget_search),
+    ("compare_specs", _match_compare_specs),
+    ("compare_models", _match_compare_models),
+    ("spec_sheet", _match_spec_sheet),
+    ("variants_with_feature", _match_variants_with_feature),
+    ("variant_price", _match_variant_price),
+]
+
+def _record(intent):
+    record_cache("intent_router", intent is not None)
+    with _stats_lock:
+        if intent is None:
+            _stats["misses"] += 1
+        else:
+            _stats["hits"] += 1
+            _stats["by_intent"][intent] = _stats["by_intent"].get(intent, 0) + 1
+
+# Compile a question to a parameterized Cypher query, or None when the LLM is needed
+def route_question(question):
+    normalized = normalize_question(question)
+    for intent, matcher in INTENT_MATCHERS:
+        params = matcher(normalized)
+        if params is not None:
+            _record(intent)
+            return {"intent": intent, "query": CYPHER_TEMPLATES[intent].strip(), "params": params}
+    _record(None)
+    return None
+
+def get_stats():
+    with _stats_lock:
+        total = _stats["hits"] + _stats["misses"]
+        return {
+            "hits": _stats["hits"],
+            "misses": _stats["misses"],
+            "hit_rate": _stats["hits"] / total if total else 0.0,
+            "by_intent": dict(_stats["by_intent"]),
+        }
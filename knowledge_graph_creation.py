@@ -1,8 +1,8 @@
-from langchain_community.graphs import Neo4jGraph
 import json
 import re
 from dotenv import load_dotenv
 import os
+from spec_data import refresh_spec_sheets
 
 load_dotenv()
 
@@ -11,8 +11,6 @@ neo4j_username = os.getenv("NEO4J_USERNAME")
 neo4j_password = os.getenv("NEO4J_PASSWORD")
 neo4j_database = os.getenv("NEO4J_DATABASE")
 
-graph = Neo4jGraph(url=neo4j_uri, username=neo4j_username, password=neo4j_password)
-
 # clean JSON keys
 def clean_key(key):
     return re.sub(r'[^a-zA-Z0-9_]', '_', key)
@@ -28,6 +26,19 @@ def create_constraints(graph):
     graph.query('CREATE CONSTRAINT BRAND_CONSTRAINT IF NOT EXISTS FOR (b:Brand) REQUIRE b.name IS UNIQUE')
     graph.query('CREATE CONSTRAINT MODEL_CONSTRAINT IF NOT EXISTS FOR (m:Model) REQUIRE m.name IS UNIQUE')
 
+# Full-text index used by the entity resolver to map extracted entities to names in one round-trip,
+# and a range index on Variant.name for spec sheet lookups
+def create_indexes(graph):
+    graph.query('CREATE FULLTEXT INDEX entity_names IF NOT EXISTS FOR (n:Brand|Model|Variant) ON EACH [n.name]')
+    graph.query('CREATE INDEX variant_name IF NOT EXISTS FOR (v:Variant) ON (v.name)')
+
+# Bump the catalog version so in-process caches built from the graph know to reload
+def bump_graph_version(graph):
+    graph.query("""
+    MERGE (g:GraphMeta {name: 'catalog'})
+    SET g.version = coalesce(g.version, 0) + 1, g.updated_at = datetime()
+    """)
+
 def create_node(graph, label, properties):
     props = ', '.join(f"{k}: '{v}'" for k, v in properties.items())
     QUERY = f"MERGE (n:{label} {{{props}}})"
@@ -103,13 +114,16 @@ def create_variant_nodes(graph, car):
 
         create_features_node(graph, variant)
 
+    # Keep each variant's denormalized spec sheet in step with the spec nodes just written
+    refresh_spec_sheets(graph, [variant['name'] for variant in car['variant']])
+
 # convert price to a numeric value
 def convert_price_to_number(price_string):
     price_string = price_string.lower().replace(",", "").strip()
 
     # Handle various cases for "crore" and "lakh"
     if any(term in price_string for term in ["crore", "cr", "crores", "cr.", "crore.", "crores."]):
-        price_string = re.sub(r"crore|crores|cr|cr\.|crore\.|crores\.", "", price_string).strip()
+        price_string = re.sub(r"crores\.|crore\.|crores|crore|cr\.|cr", "", price_string).strip()
         try:
             return int(float(price_string) * 1e7)
         except ValueError:
@@ -117,7 +131,7 @@ def convert_price_to_number(price_string):
             return None
 
     elif any(term in price_string for term in ["lakh", "lac", "lakh.", "lac.", "lakhs", "lacs"]):
-        price_string = re.sub(r"lakh|lac|lakhs|lacs|lakh\.|lac\.", "", price_string).strip()
+        price_string = re.sub(r"lakhs|lakh\.|lakh|lacs|lac\.|lac", "", price_string).strip()
         try:
             return int(float(price_string) * 1e5)
         except ValueError:
@@ -141,13 +155,27 @@ def convert_price_to_number(price_string):
             return None
 
 if __name__ == '__main__':
+    from langchain_community.graphs import Neo4jGraph
+
+    graph = Neo4jGraph(url=neo4j_uri, username=neo4j_username, password=neo4j_password)
+
     with open('formatted_car_data.json', 'r') as f:
         raw_data = json.load(f)
 
     json_data = clean_json(raw_data)
 
     create_constraints(graph)
+    create_indexes(graph)
 
     for car in json_data:
         create_brand_and_model_nodes(graph, car)
-        create_variant_nodes(graph, car)
\ No newline at end of file
+        create_variant_nodes(graph, car)
+
+    bump_graph_version(graph)
+
+    # Imported here so modules that only need the price helpers do not pull in NumPy
+    from feature_gaps import build_feature_gaps
+    from similarity_index import update_similarity_index
+    build_feature_gaps(graph)
+    # Only the variants in this load are re-vectorized, and only if their specs changed
+    update_similarity_index(graph, [variant['name'] for car in json_data for variant in car['variant']])
@@ -0,0 +1,318 @@
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+
+load_dotenv()
+
+GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+GROQ_API_ENDPOINT = os.getenv("GROQ_API_ENDPOINT")
+MODEL_NAME = "llama3-8b-8192"
+
+# off: call the LLM; record: call it and save each response; replay: serve saved responses only
+LLM_CASSETTE_MODE = os.getenv("LLM_CASSETTE_MODE", "off").strip().lower()
+CASSETTE_MODES = ("off", "record", "replay")
+# A typo must not silently fall back to live, paid calls
+if LLM_CASSETTE_MODE not in CASSETTE_MODES:
+    raise ValueError(f"LLM_CASSETTE_MODE must be one of {', '.join(CASSETTE_MODES)}, not '{LLM_CASSETTE_MODE}'.")
+LLM_CASSETTE_DIR = os.getenv("LLM_CASSETTE_DIR", "cassettes")
+
+# Client-side limits, matched to the Groq account's published rate limits
+GROQ_REQUESTS_PER_MINUTE = float(os.getenv("GROQ_REQUESTS_PER_MINUTE", "30"))
+GROQ_TOKENS_PER_MINUTE = float(os.getenv("GROQ_TOKENS_PER_MINUTE", "6000"))
+GROQ_MAX_CONCURRENCY = int(os.getenv("GROQ_MAX_CONCURRENCY", "8"))
+GROQ_QUEUE_TIMEOUT = float(os.getenv("GROQ_QUEUE_TIMEOUT", "30"))
+GROQ_CONNECT_TIMEOUT = float(os.getenv("GROQ_CONNECT_TIMEOUT", "5"))
+GROQ_READ_TIMEOUT = float(os.getenv("GROQ_READ_TIMEOUT", "60"))
+GROQ_MAX_RETRIES = int(os.getenv("GROQ_MAX_RETRIES", "4"))
+GROQ_BACKOFF_BASE = 0.5
+GROQ_BACKOFF_MAX = 20.0
+GROQ_BREAKER_THRESHOLD = int(os.getenv("GROQ_BREAKER_THRESHOLD", "5"))
+GROQ_BREAKER_COOLDOWN = float(os.getenv("GROQ_BREAKER_COOLDOWN", "30"))
+DEFAULT_COMPLETION_TOKENS = 256
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+class CassetteMiss(Exception):
+    pass
+
+# Raised instead of calling Groq when the client is saturated or the circuit is open
+class LLMUnavailable(requests.exceptions.RequestException):
+    pass
+
+# Token bucket refilled continuously; acquire blocks until enough capacity is free
+class TokenBucket:
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount, deadline):
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            if now + wait > deadline:
+                raise LLMUnavailable("Groq client-side rate limit queue timed out.")
+            time.sleep(wait)
+
+# Opens after consecutive server failures and lets one trial call through after the cooldown
+class CircuitBreaker:
+    def __init__(self, threshold, cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def _check(self, claim_trial):
+        with self._lock:
+            if self.opened_at is None:
+                return
+            if time.monotonic() - self.opened_at < self.cooldown or self._trial_in_flight:
+                raise LLMUnavailable("Groq circuit breaker is open after repeated failures.")
+            if claim_trial:
+                self._trial_in_flight = True
+
+    # Fail fast while open, without claiming the trial call
+    def check(self):
+        self._check(claim_trial=False)
+
+    # Claim the trial call when half-open; the caller must then record success, failure or release_trial
+    def before_call(self):
+        self._check(claim_trial=True)
+
+    # The trial call ended without an answer from Groq, so let the next call try instead
+    def release_trial(self):
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+request_bucket = TokenBucket(GROQ_REQUESTS_PER_MINUTE)
+token_bucket = TokenBucket(GROQ_TOKENS_PER_MINUTE)
+concurrency_limit = threading.BoundedSemaphore(GROQ_MAX_CONCURRENCY)
+breaker = CircuitBreaker(GROQ_BREAKER_THRESHOLD, GROQ_BREAKER_COOLDOWN)
+
+_session = None
+_session_lock = threading.Lock()
+
+# Keep-alive connection pool shared by every Groq call in the process
+def get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=GROQ_MAX_CONCURRENCY)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+# Forked workers get their own connection pool and an equal share of the account-wide rate limits
+def reset_after_fork(workers=1):
+    global _session, _session_lock, request_bucket, token_bucket, concurrency_limit
+    _session = None
+    _session_lock = threading.Lock()
+    request_bucket = TokenBucket(GROQ_REQUESTS_PER_MINUTE / workers)
+    token_bucket = TokenBucket(GROQ_TOKENS_PER_MINUTE / workers)
+    concurrency_limit = threading.BoundedSemaphore(GROQ_MAX_CONCURRENCY)
+
+def _headers():
+    return {
+        "Authorization": f"Bearer {GROQ_API_KEY}",
+        "Content-Type": "application/json",
+    }
+
+# Rough prompt size (~4 characters per token) plus the completion budget
+def estimate_tokens(payload):
+    prompt_chars = len(json.dumps(payload.get("messages") or payload.get("prompt") or ""))
+    return prompt_chars // 4 + int(payload.get("max_tokens") or DEFAULT_COMPLETION_TOKENS)
+
+def _retry_after(response):
+    value = response.headers.get("Retry-After") if response is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+# The server's Retry-After is honoured in full; GROQ_BACKOFF_MAX only caps our own jittered backoff
+def _backoff(attempt, response=None):
+    retry_after = _retry_after(response)
+    if retry_after is not None:
+        return retry_after
+    return random.uniform(0, min(GROQ_BACKOFF_MAX, GROQ_BACKOFF_BASE * 2 ** attempt))
+
+# Holds one of the GROQ_MAX_CONCURRENCY slots for the whole call, including a streamed body
+@contextmanager
+def concurrency_slot():
+    if not concurrency_limit.acquire(timeout=GROQ_QUEUE_TIMEOUT):
+        raise LLMUnavailable("Too many concurrent Groq requests.")
+    try:
+        yield
+    finally:
+        concurrency_limit.release()
+
+# Rate-limited, retried POST to Groq; the caller owns the returned response
+def send(payload, stream=False):
+    deadline = time.monotonic() + GROQ_QUEUE_TIMEOUT
+    for attempt in range(GROQ_MAX_RETRIES + 1):
+        # Rate-limit waits happen before the half-open trial is claimed, so a queue timeout can't strand it
+        breaker.check()
+        request_bucket.acquire(1, deadline)
+        token_bucket.acquire(estimate_tokens(payload), deadline)
+        breaker.before_call()
+        try:
+            response = get_session().post(
+                GROQ_API_ENDPOINT,
+                headers=_headers(),
+                json=payload,
+                stream=stream,
+                timeout=(GROQ_CONNECT_TIMEOUT, GROQ_READ_TIMEOUT),
+            )
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            breaker.record_failure()
+            if attempt == GROQ_MAX_RETRIES:
+                raise
+            time.sleep(_backoff(attempt))
+            continue
+        except BaseException:
+            breaker.release_trial()
+            raise
+
+        if response.status_code not in RETRY_STATUS_CODES:
+            breaker.record_success()
+            if not response.ok:
+                # A streamed error body is never read, so return its connection to the pool before raising
+                response.close()
+                response.raise_for_status()
+            return response
+
+        # 429 is back-pressure, not an outage, so only 5xx counts towards opening the circuit
+        if response.status_code == 429:
+            breaker.record_success()
+        else:
+            breaker.record_failure()
+        if attempt == GROQ_MAX_RETRIES:
+            response.raise_for_status()
+        delay = _backoff(attempt, response)
+        response.close()
+        # Retrying before the server's delay would only earn another 429, so give up if it outlasts the queue
+        if time.monotonic() + delay > deadline:
+            raise LLMUnavailable(f"Groq asked to retry after {delay:.0f}s, past the client queue timeout.")
+        time.sleep(delay)
+
+def request_hash(kind, request):
+    canonical = json.dumps({"kind": kind, "request": request}, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+def cassette_path(kind, key):
+    return os.path.join(LLM_CASSETTE_DIR, f"{kind}-{key[:24]}.json")
+
+def _write_cassette(path, kind, request, response):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    # Save to a temporary file first so concurrent readers never see a partial cassette
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump({"kind": kind, "request": request, "response": response}, f, indent=2, ensure_ascii=False, default=str)
+    os.replace(temp_path, path)
+
+def _read_cassette(path, kind, key):
+    if not os.path.exists(path):
+        raise CassetteMiss(
+            f"No recorded {kind} response for request {key[:24]} in {LLM_CASSETTE_DIR}. "
+            "Run once with LLM_CASSETTE_MODE=record to capture it."
+        )
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)["response"]
+
+# Route an LLM call through the cassette store; request must be JSON-serializable and response JSON-compatible
+def recorded(kind, request, call):
+    if LLM_CASSETTE_MODE not in ("record", "replay"):
+        return call()
+    key = request_hash(kind, request)
+    path = cassette_path(kind, key)
+    if LLM_CASSETTE_MODE == "replay":
+        return _read_cassette(path, kind, key)
+    response = call()
+    _write_cassette(path, kind, request, response)
+    return response
+
+# POST a raw payload to the Groq endpoint and return the decoded JSON response
+def post_json(payload, kind="groq"):
+    def call():
+        with concurrency_slot(), send(payload) as response:
+            return response.json()
+    return recorded(kind, payload, call)
+
+# Full chat completion response from Groq (choices, usage, ...)
+def chat_completion(messages, model=MODEL_NAME, **options):
+    payload = {"model": model, "messages": messages, **options}
+    return post_json(payload, kind="chat")
+
+def _stream_deltas(payload):
+    with concurrency_slot(), send(payload, stream=True) as response:
+        for raw_line in response.iter_lines():
+            line = raw_line.decode("utf-8")
+            # Server-sent events: only "data:" lines carry chunks, "[DONE]" ends the stream
+            if not line or not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                break
+            chunk = json.loads(data)
+            choices = chunk.get("choices") or [{}]
+            delta = choices[0].get("delta", {}).get("content")
+            if delta:
+                yield delta
+
+# Stream a chat completion from Groq, yielding content deltas as they arrive
+def stream_chat_completion(messages, model=MODEL_NAME, **options):
+    payload = {"model": model, "messages": messages, "stream": True, **options}
+    if LLM_CASSETTE_MODE not in ("record", "replay"):
+        yield from _stream_deltas(payload)
+        return
+
+    key = request_hash("chat_stream", payload)
+    path = cassette_path("chat_stream", key)
+    if LLM_CASSETTE_MODE == "replay":
+        yield from _read_cassette(path, "chat_stream", key)
+        return
+
+    deltas = []
+    for delta in _stream_deltas(payload):
+        deltas.append(delta)
+        yield delta
+    _write_cassette(path, "chat_stream", payload, deltas)
@@ -0,0 +1,293 @@
+import argparse
+import importlib.util
+import json
+import logging
+import math
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from werkzeug.serving import make_server
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Mix of intent fast-path questions and free-form ones that go through the (mock) LLM
+DEFAULT_QUESTIONS = [
+    "Suggest a petrol sedan under ₹14 Lakhs.",
+    "Price of Virtus Highline",
+    "Compare Virtus and Slavia",
+    "Which variants of Taigun have sunroof?",
+    "What is the mileage of the Virtus GT?",
+    "Which SUVs have six airbags?",
+    "List the engine options for the Taigun",
+]
+
+# Canned Cypher answers for the mock LLM, picked by keyword in the last user message
+CANNED_CYPHER = [
+    ("mileage", "MATCH (v:Variant)-[:HAS_FUEL]->(f:Fuel) WHERE toLower(v.name) CONTAINS 'virtus' RETURN v.name AS variant, f.mileage AS mileage"),
+    ("airbag", "MATCH (m:Model)-[:HAS_VARIANT]->(v:Variant)-[:HAS_SAFETY]->(s:Safety) WHERE toLower(m.type) = 'suv' RETURN v.name AS variant, s.airbags AS airbags"),
+    ("engine", "MATCH (v:Variant)-[:HAS_ENGINE]->(e:Engine) WHERE toLower(v.name) CONTAINS 'taigun' RETURN v.name AS variant, e.displacement AS displacement"),
+]
+DEFAULT_CYPHER = "MATCH (v:Variant)-[:HAS_PRICE]->(p:Price) RETURN v.name AS variant, p.ex_showroom AS price LIMIT 10"
+MOCK_ANSWER = "The Volkswagen Virtus Highline Plus is a perfect blend of power, style, and advanced features."
+
+# OpenAI-compatible chat-completions stand-in with configurable latency
+class MockLLMHandler(BaseHTTPRequestHandler):
+    latency = 0.3
+    jitter = 0.1
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        time.sleep(max(0.0, random.gauss(self.latency, self.jitter * self.latency)))
+
+        messages = payload.get("messages") or [{"role": "user", "content": payload.get("prompt", "")}]
+        question = messages[-1].get("content", "").lower()
+        system = messages[0].get("content", "").lower() if len(messages) > 1 else ""
+        if "formatter" in system:
+            content = MOCK_ANSWER
+        else:
+            cypher = next((query for keyword, query in CANNED_CYPHER if keyword in question), DEFAULT_CYPHER)
+            content = f"```{cypher}```"
+
+        if payload.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            for word in content.split(" "):
+                chunk = {"choices": [{"delta": {"content": word + " "}}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.write(b"data: [DONE]\n\n")
+            return
+
+        body = json.dumps({
+            "choices": [{"message": {"role": "assistant", "content": content}}],
+            # The Flask app's legacy completion call reads a bare "text" field
+            "text": content.strip("`"),
+            "usage": {"prompt_tokens": len(question.split()), "completion_tokens": len(content.split())},
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def start_mock_llm(latency_ms, jitter):
+    handler = type("ConfiguredMockLLMHandler", (MockLLMHandler,), {"latency": latency_ms / 1000, "jitter": jitter})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/openai/v1/chat/completions"
+
+# In-process stand-in for the Neo4j driver, Neo4jGraph and Neo4jHandler
+class MockGraph:
+    def __init__(self, latency_ms, rows):
+        self.latency = latency_ms / 1000
+        self.rows = [{"variant": f"Volkswagen Virtus Variant {i}", "price": 1100000 + i * 25000} for i in range(rows)]
+
+    def _wait(self):
+        time.sleep(max(0.0, random.gauss(self.latency, 0.1 * self.latency)))
+
+    # Driver API used by the query guard
+    def session(self, **kwargs):
+        return MockSession(self)
+
+    # Neo4jGraph / Neo4jHandler API used by the Flask apps
+    schema = "Node properties: Brand {name}, Model {name, type}, Variant {name}, Price {ex_showroom}"
+
+    def refresh_schema(self):
+        pass
+
+    def get_schema(self):
+        return self.schema
+
+    def query(self, cypher_query, params=None):
+        self._wait()
+        return list(self.rows)
+
+    def query_page(self, cypher_query, offset=0, page_size=50):
+        self._wait()
+        page = self.rows[offset:offset + page_size + 1]
+        return page[:page_size], len(page) > page_size
+
+    def close(self):
+        pass
+
+class MockRecord:
+    def __init__(self, row):
+        self._row = row
+
+    def data(self):
+        return dict(self._row)
+
+class MockSummary:
+    plan = {"operatorType": "ProduceResults@neo4j", "args": {"EstimatedRows": 10.0}, "children": []}
+
+class MockResult:
+    def __init__(self, rows):
+        self._rows = rows
+
+    def __iter__(self):
+        return (MockRecord(row) for row in self._rows)
+
+    def consume(self):
+        return MockSummary()
+
+class MockSession:
+    def __init__(self, graph):
+        self.graph = graph
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def run(self, query, params=None):
+        text = getattr(query, "text", query)
+        if text.startswith("EXPLAIN"):
+            return MockResult([])
+        self.graph._wait()
+        return MockResult(self.graph.rows)
+
+def load_app(target):
+    if target == "main":
+        path = os.path.join(ROOT_DIR, "flask_neo4j_langchain_app_updated.py")
+    else:
+        path = os.path.join(ROOT_DIR, "tests", "test2.py")
+    sys.path.insert(0, ROOT_DIR)
+    spec = importlib.util.spec_from_file_location(f"loadtest_{target}_app", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+# Point the app at the mock LLM and mock graph instead of Groq and Neo4j
+def patch_app(module, graph, llm_endpoint, llm_rpm, llm_tpm, llm_concurrency):
+    import llm_client
+    llm_client.GROQ_API_ENDPOINT = llm_endpoint
+    # The Groq account limits would otherwise throttle the mock; override them with the harness settings
+    llm_client.request_bucket = llm_client.TokenBucket(llm_rpm)
+    llm_client.token_bucket = llm_client.TokenBucket(llm_tpm)
+    llm_client.concurrency_limit = threading.BoundedSemaphore(llm_concurrency)
+    module.GROQ_API_ENDPOINT = llm_endpoint
+    module.connect_to_neo4j = lambda: graph
+    if hasattr(module, "get_driver"):
+        module.get_driver = lambda: graph
+
+def start_app(module):
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = make_server("127.0.0.1", 0, module.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+# Open-loop load: requests are sent on schedule whether or not earlier ones have finished
+def run_load(base_url, questions, rate, duration, concurrency, timeout):
+    local = threading.local()
+    results = []
+    results_lock = threading.Lock()
+
+    def send(question):
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        started = time.perf_counter()
+        try:
+            response = local.session.post(f"{base_url}/ask", json={"query": question}, timeout=timeout)
+            ok = response.status_code == 200 and isinstance(response.json().get("answer"), dict)
+        except requests.exceptions.RequestException:
+            ok = False
+        with results_lock:
+            results.append((time.perf_counter() - started, ok))
+
+    total = int(rate * duration)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for i in range(total):
+            delay = started + i / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(send, questions[i % len(questions)])
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for latency, _ in results)
+    errors = sum(1 for _, ok in results if not ok)
+    return {
+        "requests": len(results),
+        "target_rate": rate,
+        "throughput": round(len(results) / elapsed, 2) if elapsed else 0.0,
+        "error_rate": round(errors / len(results), 4) if results else 0.0,
+        "latency_ms": {
+            "mean": round(sum(latencies) / len(latencies) * 1000, 1) if latencies else 0.0,
+            "p50": round(percentile(latencies, 0.50) * 1000, 1),
+            "p90": round(percentile(latencies, 0.90) * 1000, 1),
+            "p95": round(percentile(latencies, 0.95) * 1000, 1),
+            "p99": round(percentile(latencies, 0.99) * 1000, 1),
+            "max": round(latencies[-1] * 1000, 1) if latencies else 0.0,
+        },
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test for /ask with mock LLM and graph servers.")
+    parser.add_argument("--app", choices=["main", "test2"], default="main", help="Flask app to drive")
+    parser.add_argument("--rate", type=float, default=20.0, help="Target requests per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="Test length in seconds")
+    parser.add_argument("--concurrency", type=int, default=64, help="Maximum requests in flight")
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0, help="Mean mock LLM latency")
+    parser.add_argument("--llm-jitter", type=float, default=0.2, help="Mock LLM latency stddev as a fraction of the mean")
+    parser.add_argument("--graph-latency-ms", type=float, default=20.0, help="Mean mock graph query latency")
+    parser.add_argument("--llm-rpm", type=float, default=1e6, help="Client-side LLM requests per minute")
+    parser.add_argument("--llm-tpm", type=float, default=1e9, help="Client-side LLM tokens per minute")
+    parser.add_argument("--llm-concurrency", type=int, default=64, help="Client-side concurrent LLM calls")
+    parser.add_argument("--rows", type=int, default=25, help="Rows returned by each mock graph query")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Per-request client timeout in seconds")
+    parser.add_argument("--questions", help="File with one question per line")
+    parser.add_argument("--max-p99-ms", type=float, help="Fail if p99 latency exceeds this")
+    parser.add_argument("--max-error-rate", type=float, help="Fail if the error rate exceeds this fraction")
+    parser.add_argument("--output", help="Also write the report as JSON to this file")
+    args = parser.parse_args()
+
+    questions = DEFAULT_QUESTIONS
+    if args.questions:
+        with open(args.questions, encoding="utf-8") as f:
+            questions = [line.strip() for line in f if line.strip()]
+
+    llm_server, llm_endpoint = start_mock_llm(args.llm_latency_ms, args.llm_jitter)
+    module = load_app(args.app)
+    patch_app(module, MockGraph(args.graph_latency_ms, args.rows), llm_endpoint, args.llm_rpm, args.llm_tpm, args.llm_concurrency)
+    app_server, base_url = start_app(module)
+
+    try:
+        report = run_load(base_url, questions, args.rate, args.duration, args.concurrency, args.timeout)
+    finally:
+        app_server.shutdown()
+        llm_server.shutdown()
+
+    report["app"] = args.app
+    print(json.dumps(report, indent=4))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=4)
+
+    failures = []
+    if args.max_p99_ms is not None and report["latency_ms"]["p99"] > args.max_p99_ms:
+        failures.append(f"p99 {report['latency_ms']['p99']} ms exceeds {args.max_p99_ms} ms")
+    if args.max_error_rate is not None and report["error_rate"] > args.max_error_rate:
+        failures.append(f"error rate {report['error_rate']} exceeds {args.max_error_rate}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
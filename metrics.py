@@ -0,0 +1,226 @@
+import glob
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Under a preforking server each worker writes its series here and /metrics sums every worker's file
+METRICS_MULTIPROC_DIR = os.getenv("METRICS_MULTIPROC_DIR")
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "1"))
+
+# Latency buckets in seconds, from a cache hit up to a slow LLM completion
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labelnames, labelvalues, extra=None):
+    pairs = list(zip(labelnames, labelvalues)) + (extra or [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label(value)}"' for name, value in pairs) + "}"
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def collect(self):
+        with self._lock:
+            return dict(self._values)
+
+    def reset(self):
+        self._lock = threading.Lock()
+        self._values = {}
+
+    @staticmethod
+    def combine(total, value):
+        return total + value
+
+    def render(self, values=None):
+        values = self.collect() if values is None else values
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            series = self._series.setdefault(key, {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0})
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["buckets"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def collect(self):
+        with self._lock:
+            return {key: {**series, "buckets": list(series["buckets"])} for key, series in self._series.items()}
+
+    def reset(self):
+        self._lock = threading.Lock()
+        self._series = {}
+
+    @staticmethod
+    def combine(total, series):
+        return {
+            "buckets": [a + b for a, b in zip(total["buckets"], series["buckets"])],
+            "sum": total["sum"] + series["sum"],
+            "count": total["count"] + series["count"],
+        }
+
+    def render(self, values=None):
+        values = self.collect() if values is None else values
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for key, series in sorted(values.items()):
+            for bound, count in zip(self.buckets, series["buckets"]):
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', bound)])} {count}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', '+Inf')])} {series['count']}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {series['sum']}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {series['count']}")
+        return lines
+
+STAGE_DURATION = Histogram("vwisionaries_stage_duration_seconds", "Time spent in each query pipeline stage.", ["stage"])
+STAGE_ERRORS = Counter("vwisionaries_stage_errors_total", "Pipeline stages that raised an exception.", ["stage"])
+LLM_TOKENS = Counter("vwisionaries_llm_tokens_total", "LLM tokens reported by the API, by stage and kind.", ["stage", "kind"])
+RESULT_ROWS = Counter("vwisionaries_result_rows_total", "Rows returned by graph queries, by stage.", ["stage"])
+CACHE_REQUESTS = Counter("vwisionaries_cache_requests_total", "Cache and fast-path lookups, by cache and result.", ["cache", "result"])
+
+REGISTRY = [STAGE_DURATION, STAGE_ERRORS, LLM_TOKENS, RESULT_ROWS, CACHE_REQUESTS]
+
+# Per-query breakdown of the stages run in the current context
+_current_trace = ContextVar("current_trace", default=None)
+
+@contextmanager
+def trace():
+    entries = []
+    token = _current_trace.set(entries)
+    try:
+        yield entries
+    finally:
+        _current_trace.reset(token)
+
+def _trace_entry(stage):
+    entries = _current_trace.get()
+    if entries is None:
+        return {}
+    for entry in entries:
+        if entry["stage"] == stage:
+            return entry
+    entry = {"stage": stage}
+    entries.append(entry)
+    return entry
+
+@contextmanager
+def timed(stage):
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.inc(stage=stage)
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_DURATION.observe(elapsed, stage=stage)
+        entry = _trace_entry(stage)
+        entry["ms"] = round(entry.get("ms", 0) + elapsed * 1000, 1)
+
+# usage is the OpenAI-style block returned with a completion
+def record_tokens(stage, usage):
+    if not usage:
+        return
+    entry = _trace_entry(stage)
+    for kind in ("prompt_tokens", "completion_tokens"):
+        if usage.get(kind):
+            LLM_TOKENS.inc(usage[kind], stage=stage, kind=kind.replace("_tokens", ""))
+            entry[kind] = entry.get(kind, 0) + usage[kind]
+
+def record_rows(stage, count):
+    RESULT_ROWS.inc(count, stage=stage)
+    entry = _trace_entry(stage)
+    entry["rows"] = entry.get("rows", 0) + count
+
+def record_cache(cache, hit):
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+    entries = _current_trace.get()
+    if entries is not None:
+        entries.append({"stage": f"cache:{cache}", "result": "hit" if hit else "miss"})
+
+def _snapshot_path(pid=None):
+    return os.path.join(METRICS_MULTIPROC_DIR, f"metrics-{pid or os.getpid()}.json")
+
+# Start a server run with an empty snapshot directory; called once in the master before forking
+def clear_multiprocess_dir():
+    os.makedirs(METRICS_MULTIPROC_DIR, exist_ok=True)
+    for path in glob.glob(_snapshot_path("*")):
+        os.remove(path)
+
+# Write this process's series; files of exited workers are kept so counters never go backwards
+def write_snapshot():
+    path = _snapshot_path()
+    data = {metric.name: [[list(key), value] for key, value in metric.collect().items()] for metric in REGISTRY}
+    # Save to a temporary file first so a scrape never reads a half-written snapshot
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(temp_path, path)
+
+def _read_snapshots():
+    merged = {metric.name: {} for metric in REGISTRY}
+    for path in glob.glob(_snapshot_path("*")):
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for metric in REGISTRY:
+            values = merged[metric.name]
+            for key, value in data.get(metric.name, []):
+                key = tuple(key)
+                values[key] = metric.combine(values[key], value) if key in values else value
+    return merged
+
+def _flush_loop():
+    while True:
+        time.sleep(METRICS_FLUSH_INTERVAL)
+        try:
+            write_snapshot()
+        except OSError as e:
+            print(f"Error writing metrics snapshot: {e}")
+
+# Called in each forked worker: series inherited from the master are already in the master's snapshot
+def reset_after_fork():
+    for metric in REGISTRY:
+        metric.reset()
+    if METRICS_MULTIPROC_DIR:
+        threading.Thread(target=_flush_loop, name="metrics-flush", daemon=True).start()
+
+def render_prometheus():
+    if METRICS_MULTIPROC_DIR:
+        # Other workers' series are at most METRICS_FLUSH_INTERVAL old; this worker's are current
+        write_snapshot()
+        merged = _read_snapshots()
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render(merged[metric.name] if METRICS_MULTIPROC_DIR else None))
+    return "\n".join(lines) + "\n"
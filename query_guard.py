@@ -0,0 +1,163 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+from itertools import islice
+from neo4j import Query, READ_ACCESS
+from metrics import timed, record_cache
+
+# Limits applied to every generated query before it reaches the database
+MAX_RESULT_ROWS = int(os.getenv("CYPHER_MAX_ROWS", "200"))
+MAX_ESTIMATED_ROWS = int(os.getenv("CYPHER_MAX_ESTIMATED_ROWS", "100000"))
+QUERY_TIMEOUT_SECONDS = float(os.getenv("CYPHER_TIMEOUT_SECONDS", "10"))
+VERDICT_CACHE_SIZE = 512
+
+WRITE_CLAUSE_PATTERN = re.compile(r"\b(CREATE|MERGE|DELETE|DETACH|SET|REMOVE|DROP|FOREACH|LOAD\s+CSV)\b", re.IGNORECASE)
+ADMIN_CALL_PATTERN = re.compile(r"\bCALL\s+(dbms|apoc|gds|db\.(create|drop|clear))", re.IGNORECASE)
+# String literals and quoted identifiers, or comments outside them
+LITERAL = r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"|`[^`]*`"
+COMMENT_PATTERN = re.compile(rf"({LITERAL})|//[^\n]*|/\*.*?\*/", re.DOTALL)
+WHITESPACE_PATTERN = re.compile(rf"({LITERAL})|\s+")
+LITERAL_PATTERN = re.compile(LITERAL)
+TRAILING_LIMIT_PATTERN = re.compile(r"\bLIMIT\s+(\d+)\s*$", re.IGNORECASE)
+PAGE_WINDOW_PATTERN = re.compile(r"(?:\bSKIP\s+(\d+)\s+)?\bLIMIT\s+(\d+)\s*$", re.IGNORECASE)
+TRAILING_PARAM_LIMIT_PATTERN = re.compile(r"\bLIMIT\s+\$\w+\s*$", re.IGNORECASE)
+UNION_PATTERN = re.compile(r"\bUNION\b", re.IGNORECASE)
+WRAPPED_UNION_PATTERN = re.compile(r"^CALL \{ .* \} RETURN \*(?: LIMIT \d+)?$", re.IGNORECASE | re.DOTALL)
+
+# Plan operators that touch every node (of a label) or multiply independent matches
+EXPENSIVE_OPERATORS = ("CartesianProduct", "AllNodesScan", "NodeByLabelScan")
+
+class QueryRejected(Exception):
+    pass
+
+_verdict_lock = threading.Lock()
+_verdicts = OrderedDict()
+
+# Drop comments, then collapse whitespace onto one line; string literals are left untouched by both
+def normalize_query(cypher_query):
+    cypher_query = COMMENT_PATTERN.sub(lambda m: m.group(1) or " ", cypher_query)
+    cypher_query = WHITESPACE_PATTERN.sub(lambda m: m.group(1) or " ", cypher_query)
+    return cypher_query.strip().rstrip(";").strip()
+
+# Keyword checks only look at the query text outside string literals ("CONTAINS 'Set'" is a read)
+def check_read_only(cypher_query):
+    code = LITERAL_PATTERN.sub("''", cypher_query)
+    if ";" in code:
+        raise QueryRejected("Multiple statements are not allowed.")
+    if WRITE_CLAUSE_PATTERN.search(code) or ADMIN_CALL_PATTERN.search(code):
+        raise QueryRejected("Only read queries are allowed.")
+    if not re.match(r"^(MATCH|OPTIONAL MATCH|WITH|UNWIND|CALL|RETURN)\b", cypher_query, re.IGNORECASE):
+        raise QueryRejected("Query must start with a read clause such as MATCH.")
+
+# A trailing LIMIT or SKIP only applies to the last branch of a UNION, so such queries run as one subquery
+def wrap_union(cypher_query):
+    if WRAPPED_UNION_PATTERN.match(cypher_query) or not UNION_PATTERN.search(LITERAL_PATTERN.sub("''", cypher_query)):
+        return cypher_query
+    return f"CALL {{ {cypher_query} }} RETURN *"
+
+# Cap an existing trailing LIMIT or append one
+def apply_limit(cypher_query, max_rows=MAX_RESULT_ROWS):
+    cypher_query = wrap_union(cypher_query)
+    match = TRAILING_LIMIT_PATTERN.search(cypher_query)
+    if match:
+        limit = min(int(match.group(1)), max_rows)
+        return cypher_query[:match.start()] + f"LIMIT {limit}"
+    if TRAILING_PARAM_LIMIT_PATTERN.search(cypher_query):
+        return cypher_query
+    return f"{cypher_query} LIMIT {max_rows}"
+
+# Plans are dicts of Bolt metadata on recent drivers and objects on older ones
+def _plan_field(plan, *names):
+    for name in names:
+        value = plan.get(name) if isinstance(plan, dict) else getattr(plan, name, None)
+        if value is not None:
+            return value
+    return None
+
+# Walk an EXPLAIN plan and return the first operator that breaks the budget
+def find_expensive_operator(plan, max_estimated_rows=MAX_ESTIMATED_ROWS):
+    if plan is None:
+        return None
+    operator = (_plan_field(plan, "operatorType", "operator_type") or "").split("@")[0]
+    arguments = _plan_field(plan, "args", "arguments") or {}
+    estimated_rows = arguments.get("EstimatedRows", 0) or 0
+    if operator in EXPENSIVE_OPERATORS and estimated_rows > max_estimated_rows:
+        return f"{operator} over ~{int(estimated_rows)} rows"
+    for child in _plan_field(plan, "children") or []:
+        found = find_expensive_operator(child, max_estimated_rows)
+        if found:
+            return found
+    return None
+
+def _cached_verdict(cypher_query):
+    with _verdict_lock:
+        if cypher_query in _verdicts:
+            _verdicts.move_to_end(cypher_query)
+            return _verdicts[cypher_query]
+    return None
+
+def _store_verdict(cypher_query, verdict):
+    with _verdict_lock:
+        _verdicts[cypher_query] = verdict
+        _verdicts.move_to_end(cypher_query)
+        while len(_verdicts) > VERDICT_CACHE_SIZE:
+            _verdicts.popitem(last=False)
+
+# Validate, bound and EXPLAIN a query; returns the query to run or raises QueryRejected
+def guard_query(session, cypher_query, params=None):
+    cypher_query = normalize_query(cypher_query)
+    check_read_only(cypher_query)
+    cypher_query = apply_limit(cypher_query)
+
+    verdict = _cached_verdict(cypher_query)
+    record_cache("query_guard_verdict", verdict is not None)
+    if verdict is None:
+        with timed("query_guard_explain"):
+            summary = session.run(f"EXPLAIN {cypher_query}", params or {}).consume()
+        reason = find_expensive_operator(summary.plan)
+        verdict = (reason is None, reason)
+        _store_verdict(cypher_query, verdict)
+
+    allowed, reason = verdict
+    if not allowed:
+        raise QueryRejected(f"Query plan is too expensive: {reason}.")
+    return cypher_query
+
+# Run a generated query behind the guard with a server-side transaction timeout
+# Sessions are opened in read access mode so the server rejects any write the checks above miss
+def run_guarded(driver, cypher_query, params=None):
+    with driver.session(default_access_mode=READ_ACCESS) as session:
+        guarded_query = guard_query(session, cypher_query, params)
+        result = session.run(Query(guarded_query, timeout=QUERY_TIMEOUT_SECONDS), params or {})
+        return [record.data() for record in result]
+
+# Push a page window (one extra row to detect more pages) into the query so the server stops after it.
+# Returns the query, its params and the rows still to skip on the client, or None when the query has no rows left.
+def page_window(cypher_query, params, offset, page_size):
+    params = dict(params or {})
+    cypher_query = wrap_union(normalize_query(cypher_query))
+    if TRAILING_PARAM_LIMIT_PATTERN.search(cypher_query):
+        return cypher_query, params, offset
+    match = PAGE_WINDOW_PATTERN.search(cypher_query)
+    if match:
+        base_skip = int(match.group(1) or 0)
+        remaining = int(match.group(2)) - offset
+        if remaining <= 0:
+            return None
+        cypher_query = cypher_query[:match.start()].rstrip()
+    else:
+        base_skip, remaining = 0, page_size + 1
+    params.update({"_page_skip": base_skip + offset, "_page_limit": min(page_size + 1, remaining)})
+    return f"{cypher_query} SKIP $_page_skip LIMIT $_page_limit", params, 0
+
+# Run one page of a generated query, pulling only the records that page needs from the driver
+def run_guarded_page(driver, cypher_query, params=None, offset=0, page_size=50):
+    with driver.session(default_access_mode=READ_ACCESS, fetch_size=page_size + 1) as session:
+        window = page_window(guard_query(session, cypher_query, params), params, offset, page_size)
+        if window is None:
+            return [], False
+        guarded_query, params, skip = window
+        result = session.run(Query(guarded_query, timeout=QUERY_TIMEOUT_SECONDS), params)
+        records = [record.data() for record in islice(result, skip, skip + page_size + 1)]
+        return records[:page_size], len(records) > page_size
@@ -0,0 +1,119 @@
+import json
+import re
+from spec_data import SPEC_SHEET_PROPERTY, flatten_specs
+
+# Results bigger than this are left to the LLM, which can summarise instead of listing everything
+MAX_TEMPLATE_ROWS = 50
+MAX_TABLE_COLUMNS = 6
+
+NAME_KEY_PATTERN = re.compile(r"name|variant|model|brand", re.IGNORECASE)
+PRICE_KEY_PATTERN = re.compile(r"price|ex_showroom", re.IGNORECASE)
+
+EMPTY_RESPONSE = "No matching results were found in the knowledge graph."
+
+def is_scalar(value):
+    return value is None or isinstance(value, (str, int, float, bool))
+
+# "m.name" / "ex_showroom" -> "Name" / "Ex Showroom"
+def humanize_key(key):
+    key = key.split(".")[-1]
+    return re.sub(r"[_\s]+", " ", key).strip().title()
+
+# Rupee amounts in the Indian units the data is scraped in
+def format_price(value):
+    try:
+        amount = float(str(value).replace(",", "").replace("₹", "").strip())
+    except ValueError:
+        return str(value)
+    if amount >= 1e7:
+        return f"₹{amount / 1e7:.2f} Crore"
+    if amount >= 1e5:
+        return f"₹{amount / 1e5:.2f} Lakh"
+    return f"₹{amount:,.0f}"
+
+def format_value(key, value):
+    if value is None:
+        return "N/A"
+    if isinstance(value, bool):
+        return "Yes" if value else "No"
+    if PRICE_KEY_PATTERN.search(key):
+        return format_price(value)
+    return str(value)
+
+def format_scalar(row):
+    key, value = next(iter(row.items()))
+    return f"{humanize_key(key)}: {format_value(key, value)}"
+
+def format_record(row):
+    return "\n".join(f"- **{humanize_key(k)}:** {format_value(k, v)}" for k, v in row.items())
+
+def format_price_list(rows, name_key, price_key):
+    lines = []
+    for row in rows:
+        extras = [format_value(k, v) for k, v in row.items() if k not in (name_key, price_key)]
+        label = " ".join([str(row[name_key])] + extras)
+        lines.append(f"- {label}: {format_value(price_key, row[price_key])}")
+    return "\n".join(lines)
+
+def format_table(rows, keys):
+    header = "| " + " | ".join(humanize_key(k) for k in keys) + " |"
+    separator = "| " + " | ".join("---" for _ in keys) + " |"
+    body = ["| " + " | ".join(format_value(k, row[k]) for k in keys) + " |" for row in rows]
+    return "\n".join([header, separator] + body)
+
+# One variant as sections per spec group, several as a side-by-side table of the specs any of them list
+def format_spec_sheets(rows):
+    sheets = {row["variant"]: flatten_specs(json.loads(row[SPEC_SHEET_PROPERTY])) for row in rows}
+    if len(sheets) == 1:
+        variant, specs = next(iter(sheets.items()))
+        lines = [f"**{variant}**"]
+        group = None
+        for key in sorted(specs):
+            label, name = key.split(".", 1)
+            if label != group:
+                group = label
+                lines.append(f"\n**{label}**")
+            lines.append(f"- {humanize_key(name)}: {format_value(key, specs[key])}")
+        return "\n".join(lines)
+
+    keys = sorted({key for specs in sheets.values() for key in specs})
+    header = "| Spec | " + " | ".join(sheets) + " |"
+    separator = "| --- | " + " | ".join("---" for _ in sheets) + " |"
+    body = [
+        f"| {key.split('.', 1)[0]}: {humanize_key(key.split('.', 1)[1])} | "
+        + " | ".join(format_value(key, specs.get(key)) for specs in sheets.values()) + " |"
+        for key in keys
+    ]
+    return "\n".join([header, separator] + body)
+
+# Render common result shapes with templates; returns None when the shape needs the LLM
+def format_result(data):
+    if not data:
+        return EMPTY_RESPONSE
+    if not isinstance(data, list) or len(data) > MAX_TEMPLATE_ROWS:
+        return None
+    if not all(isinstance(row, dict) and row and all(is_scalar(v) for v in row.values()) for row in data):
+        return None
+
+    keys = list(data[0].keys())
+    if any(list(row.keys()) != keys for row in data):
+        return None
+
+    # Spec sheets not projected yet (null) are left to the LLM
+    if SPEC_SHEET_PROPERTY in keys and "variant" in keys:
+        return format_spec_sheets(data) if all(row[SPEC_SHEET_PROPERTY] for row in data) else None
+
+    if len(data) == 1:
+        return format_scalar(data[0]) if len(keys) == 1 else format_record(data[0])
+
+    name_keys = [k for k in keys if NAME_KEY_PATTERN.search(k) and not PRICE_KEY_PATTERN.search(k)]
+    price_keys = [k for k in keys if PRICE_KEY_PATTERN.search(k)]
+    if len(keys) <= 3 and name_keys and len(price_keys) == 1:
+        return format_price_list(data, name_keys[0], price_keys[0])
+
+    if len(keys) == 1:
+        return "\n".join(f"- {format_value(keys[0], row[keys[0]])}" for row in data)
+
+    if len(keys) <= MAX_TABLE_COLUMNS:
+        return format_table(data, keys)
+    return None
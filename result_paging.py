@@ -0,0 +1,47 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+
+DEFAULT_PAGE_SIZE = int(os.getenv("RESULT_PAGE_SIZE", "50"))
+MAX_PAGE_SIZE = 500
+PREVIEW_ROWS = 5
+
+# Cursors carry the query to resume, so they are signed; without a configured secret they only live as long as the process
+CURSOR_SECRET = (os.getenv("RESULT_CURSOR_SECRET") or "").encode() or os.urandom(32)
+
+class InvalidCursor(Exception):
+    pass
+
+def clamp_page_size(page_size):
+    try:
+        page_size = int(page_size or DEFAULT_PAGE_SIZE)
+    except (TypeError, ValueError):
+        page_size = DEFAULT_PAGE_SIZE
+    return max(1, min(page_size, MAX_PAGE_SIZE))
+
+def _sign(body):
+    return hmac.new(CURSOR_SECRET, body, hashlib.sha256).digest()[:16]
+
+# Opaque, tamper-proof cursor for the next page of a query
+def encode_cursor(cypher_query, params, offset):
+    body = json.dumps({"q": cypher_query, "p": params or {}, "o": offset}, separators=(",", ":"), default=str).encode()
+    return base64.urlsafe_b64encode(_sign(body) + body).decode().rstrip("=")
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+    except (ValueError, TypeError):
+        raise InvalidCursor("Cursor is malformed.")
+    signature, body = raw[:16], raw[16:]
+    if not hmac.compare_digest(signature, _sign(body)):
+        raise InvalidCursor("Cursor is invalid or has expired.")
+    state = json.loads(body)
+    return state["q"], state["p"], state["o"]
+
+# Short text preview of a result for chat history, instead of the full dump
+def preview_rows(rows, limit=PREVIEW_ROWS):
+    if len(rows) <= limit:
+        return str(rows)
+    return f"{rows[:limit]} ... ({len(rows) - limit} more rows)"
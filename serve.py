@@ -0,0 +1,81 @@
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+# Startup-optimized entry point for the Flask API. Imports, the schema snapshot and the precomputed
+# indexes are loaded once in the master process; workers forked from it share them copy-on-write
+# and only open their own connection pools. Metrics are summed across workers through METRICS_MULTIPROC_DIR;
+# intent stats and in-flight dedup stay per worker.
+#
+#   gunicorn -c gunicorn.conf.py serve:app
+#
+# Set PYTHONPROFILEIMPORTTIME=1 for a per-module import breakdown on stderr in addition to the report below.
+
+boot_started = time.perf_counter()
+boot_timings = []
+
+@contextmanager
+def boot_stage(name):
+    modules_before = len(sys.modules)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        boot_timings.append((name, time.perf_counter() - started, len(sys.modules) - modules_before))
+
+def report_boot():
+    print("Boot profile (stage, seconds, modules imported):")
+    for name, seconds, modules in boot_timings:
+        print(f"  {name:<20} {seconds:7.3f}s  {modules:5d}")
+    print(f"  {'total':<20} {time.perf_counter() - boot_started:7.3f}s  {len(sys.modules):5d} loaded")
+
+def preload():
+    import metrics
+    if metrics.METRICS_MULTIPROC_DIR:
+        metrics.clear_multiprocess_dir()
+    with boot_stage("import app"):
+        import flask_neo4j_langchain_app_updated as api
+    with boot_stage("import graph client"):
+        from langchain_community.graphs import Neo4jGraph  # noqa: F401
+    with boot_stage("schema snapshot"):
+        if api.get_schema_snapshot() is None:
+            print("Schema snapshot skipped: failed to connect to Neo4j.")
+    with boot_stage("feature gaps"):
+        from feature_gaps import load_feature_gaps
+        load_feature_gaps()
+    with boot_stage("similarity index"):
+        from similarity_index import get_similarity_index
+        get_similarity_index()
+    with boot_stage("llm client"):
+        import llm_client
+        llm_client.get_session()
+    # Sockets must not be shared between processes, so the master's connections are closed before forking
+    api.close_connections()
+    llm_client.reset_after_fork()
+    # Anything recorded while booting is counted once, under the master's pid
+    if metrics.METRICS_MULTIPROC_DIR:
+        metrics.write_snapshot()
+    report_boot()
+    return api
+
+# Called in each worker right after fork: fresh pools, warmed before the first request arrives
+def init_worker(workers):
+    import flask_neo4j_langchain_app_updated as api
+    import llm_client
+    import metrics
+
+    started = time.perf_counter()
+    metrics.reset_after_fork()
+    api.reset_after_fork()
+    llm_client.reset_after_fork(workers)
+    try:
+        api.get_driver().verify_connectivity()
+    except Exception as e:
+        print(f"Worker {os.getpid()} could not reach Neo4j yet: {e}")
+    print(f"Worker {os.getpid()} ready in {time.perf_counter() - started:.3f}s")
+
+app = preload().app
+
+if __name__ == "__main__":
+    app.run(host='0.0.0.0', port=5000)
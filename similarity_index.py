@@ -0,0 +1,274 @@
+import hashlib
+import json
+import os
+import sys
+import threading
+import numpy as np
+from dotenv import load_dotenv
+from spec_data import fetch_variant_specs, flatten_specs, feature_flag, numeric_value
+
+load_dotenv()
+
+SIMILARITY_INDEX_PATH = os.getenv("SIMILARITY_INDEX_PATH", "similarity_index.npz")
+# Spec keys present on fewer variants than this are too sparse to compare on
+MIN_COLUMN_COVERAGE = float(os.getenv("SIMILARITY_MIN_COVERAGE", "0.2"))
+DEFAULT_TOP_K = 5
+MAX_TOP_K = 50
+
+BODY_TYPE_PREFIX = "body_type."
+
+# Numeric and yes/no spec values of a variant, plus a one-hot body type; price is a filter, not a feature
+def variant_attributes(variant):
+    attributes = {}
+    for key, value in flatten_specs(variant["specs"]).items():
+        if key.startswith("Price."):
+            continue
+        flag = feature_flag(value)
+        if flag is not None:
+            attributes[key] = 1.0 if flag else 0.0
+            continue
+        number = numeric_value(value)
+        if number is not None:
+            attributes[key] = number
+    attributes[BODY_TYPE_PREFIX + variant["body_type"]] = 1.0
+    return attributes
+
+# Changes whenever anything the vector or the filters depend on changes
+def variant_fingerprint(variant):
+    canonical = json.dumps(
+        [variant["brand"], variant["model"], variant["body_type"], variant["specs"]],
+        sort_keys=True, default=str,
+    )
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+def _select_columns(attribute_rows):
+    counts = {}
+    for attributes in attribute_rows:
+        for key in attributes:
+            counts[key] = counts.get(key, 0) + 1
+    minimum = MIN_COLUMN_COVERAGE * len(attribute_rows)
+    return sorted(key for key, count in counts.items() if key.startswith(BODY_TYPE_PREFIX) or count >= minimum)
+
+def _raw_matrix(columns, attribute_rows):
+    column = {key: i for i, key in enumerate(columns)}
+    raw = np.full((len(attribute_rows), len(columns)), np.nan, dtype=np.float64)
+    for row, attributes in enumerate(attribute_rows):
+        for key, value in attributes.items():
+            i = column.get(key)
+            if i is not None:
+                raw[row, i] = value
+    # A variant has exactly one body type, so the other one-hot columns are known zeros
+    body_columns = [i for i, key in enumerate(columns) if key.startswith(BODY_TYPE_PREFIX)]
+    raw[:, body_columns] = np.nan_to_num(raw[:, body_columns], nan=0.0)
+    return raw
+
+class SimilarityIndex:
+    """Unit-length spec vectors for every variant in one contiguous float32 array, searched by cosine similarity."""
+
+    def __init__(self, columns, mean, scale, ids, brands, models, prices, fuels, fingerprints, vectors):
+        self.columns = list(columns)
+        self.mean = mean
+        self.scale = scale
+        self.ids = list(ids)
+        self.brands = np.asarray(brands, dtype=str)
+        self.models = np.asarray(models, dtype=str)
+        self.prices = np.asarray(prices, dtype=np.float64)
+        self.fuels = np.asarray(fuels, dtype=str)
+        self.fingerprints = list(fingerprints)
+        self.vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        self._reindex()
+
+    # Lookup tables derived from ids/models/fuels, refreshed whenever those change
+    def _reindex(self):
+        self._positions = {name: i for i, name in enumerate(self.ids)}
+        self._lower_positions = {name.lower(): i for i, name in enumerate(self.ids)}
+        # Substring filters run over the few distinct models/fuels, then map back to rows through the codes
+        self._model_names, self._model_codes = np.unique(np.char.lower(self.models), return_inverse=True)
+        self._fuel_names, self._fuel_codes = np.unique(np.char.lower(self.fuels), return_inverse=True)
+        self._model_codes = self._model_codes.reshape(-1)
+        self._fuel_codes = self._fuel_codes.reshape(-1)
+
+    @classmethod
+    def build(cls, variants):
+        attribute_rows = [variant_attributes(variant) for variant in variants]
+        columns = _select_columns(attribute_rows)
+        raw = _raw_matrix(columns, attribute_rows)
+        # Column statistics are fixed at build time so incremental updates stay comparable
+        with np.errstate(all="ignore"):
+            mean = np.nan_to_num(np.nanmean(raw, axis=0)) if len(raw) else np.zeros(len(columns))
+            scale = np.nan_to_num(np.nanstd(raw, axis=0)) if len(raw) else np.ones(len(columns))
+        scale[scale == 0] = 1.0
+        index = cls(columns, mean, scale, [], [], [], [], [], [], np.zeros((0, len(columns)), dtype=np.float32))
+        index.upsert(variants)
+        return index
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _vectorize(self, variants):
+        raw = _raw_matrix(self.columns, [variant_attributes(variant) for variant in variants])
+        # Missing values sit at the column mean, i.e. contribute nothing after standardizing
+        standardized = np.where(np.isnan(raw), 0.0, (raw - self.mean) / self.scale)
+        norms = np.linalg.norm(standardized, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return (standardized / norms).astype(np.float32)
+
+    # Add new variants and re-vectorize changed ones; unchanged variants are skipped. Returns the number changed.
+    def upsert(self, variants):
+        changed = [
+            variant for variant in variants
+            if self._positions.get(variant["variant"]) is None
+            or self.fingerprints[self._positions[variant["variant"]]] != variant_fingerprint(variant)
+        ]
+        if not changed:
+            return 0
+
+        vectors = self._vectorize(changed)
+        # Fixed-width string arrays can't take longer values in place, so edit as lists and rebuild them
+        brands, models, fuels = self.brands.tolist(), self.models.tolist(), self.fuels.tolist()
+        prices = self.prices.tolist()
+        appended = []
+        for variant, vector in zip(changed, vectors):
+            fields = (variant["brand"], variant["model"], np.nan if variant["price"] is None else variant["price"],
+                      variant["fuel"] or "", variant_fingerprint(variant))
+            position = self._positions.get(variant["variant"])
+            if position is None:
+                position = len(self.ids)
+                self.ids.append(variant["variant"])
+                for values in (brands, models, prices, fuels, self.fingerprints):
+                    values.append(None)
+                appended.append(vector)
+            else:
+                self.vectors[position] = vector
+            brands[position], models[position], prices[position], fuels[position], self.fingerprints[position] = fields
+
+        self.brands = np.asarray(brands, dtype=str)
+        self.models = np.asarray(models, dtype=str)
+        self.prices = np.asarray(prices, dtype=np.float64)
+        self.fuels = np.asarray(fuels, dtype=str)
+        if appended:
+            self.vectors = np.ascontiguousarray(np.vstack([self.vectors, np.asarray(appended)]), dtype=np.float32)
+        self._reindex()
+        return len(changed)
+
+    # Rows of a variant by exact name, else every variant of the models whose name contains it
+    def find(self, name):
+        name = name.strip().lower()
+        # An empty name would be contained in every model name
+        if not name:
+            return np.array([], dtype=np.intp)
+        if name in self._lower_positions:
+            return np.array([self._lower_positions[name]])
+        return np.flatnonzero((np.char.find(self._model_names, name) >= 0)[self._model_codes])
+
+    # Top-k variants most similar to the named variant or model, after price and fuel pre-filters
+    def similar_to(self, name, k=DEFAULT_TOP_K, max_price=None, fuel=None, cheaper=False):
+        reference = self.find(name)
+        if len(reference) == 0:
+            return None
+
+        query = self.vectors[reference].mean(axis=0)
+        query /= np.linalg.norm(query) or 1.0
+        reference_price = np.nanmin(self.prices[reference]) if not np.isnan(self.prices[reference]).all() else None
+
+        mask = ~np.isin(self._model_codes, self._model_codes[reference])
+        if max_price is not None:
+            mask &= self.prices <= max_price
+        # "Cheaper" means strictly below the reference's cheapest variant
+        if cheaper and reference_price is not None:
+            mask &= self.prices < reference_price
+        if fuel:
+            mask &= (np.char.find(self._fuel_names, fuel.strip().lower()) >= 0)[self._fuel_codes]
+
+        candidates = np.flatnonzero(mask)
+        scores = self.vectors[candidates] @ query
+        k = min(k, len(candidates))
+        top = np.argpartition(-scores, k - 1)[:k] if k else np.array([], dtype=int)
+        top = top[np.argsort(-scores[top])]
+        return {
+            "reference": {
+                "name": name,
+                "variants": [self.ids[i] for i in reference],
+                "min_price": None if reference_price is None else float(reference_price),
+            },
+            "results": [self._describe(candidates[i], scores[i]) for i in top],
+        }
+
+    def _describe(self, position, score):
+        price = self.prices[position]
+        return {
+            "brand": str(self.brands[position]),
+            "model": str(self.models[position]),
+            "variant": self.ids[position],
+            "price": None if np.isnan(price) else float(price),
+            "fuel": str(self.fuels[position]) or None,
+            "similarity": round(float(score), 4),
+        }
+
+    def save(self, path=SIMILARITY_INDEX_PATH):
+        # Save to a temporary file first so the API never loads a half-written index
+        temp_path = f"{path}.tmp.npz"
+        np.savez(
+            temp_path,
+            columns=np.asarray(self.columns, dtype=str),
+            mean=self.mean,
+            scale=self.scale,
+            ids=np.asarray(self.ids, dtype=str),
+            brands=self.brands,
+            models=self.models,
+            prices=self.prices,
+            fuels=self.fuels,
+            fingerprints=np.asarray(self.fingerprints, dtype=str),
+            vectors=self.vectors,
+        )
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path=SIMILARITY_INDEX_PATH):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                data["columns"].tolist(), data["mean"], data["scale"], data["ids"].tolist(), data["brands"],
+                data["models"], data["prices"], data["fuels"], data["fingerprints"].tolist(), data["vectors"],
+            )
+
+# Full rebuild: recomputes the column set and statistics from every variant in the graph
+def build_similarity_index(graph, path=SIMILARITY_INDEX_PATH):
+    index = SimilarityIndex.build(fetch_variant_specs(graph))
+    index.save(path)
+    print(f"Similarity index with {len(index)} variants and {len(index.columns)} dimensions written to {path}")
+    return index
+
+# Incremental update after the loader has written the given variants; builds from scratch if there is no index yet
+def update_similarity_index(graph, names, path=SIMILARITY_INDEX_PATH):
+    if not os.path.exists(path):
+        return build_similarity_index(graph, path)
+    index = SimilarityIndex.load(path)
+    changed = index.upsert(fetch_variant_specs(graph, list(names)))
+    if changed:
+        index.save(path)
+    print(f"Similarity index updated: {changed} of {len(index)} variants re-vectorized")
+    return index
+
+_cache = {"mtime": None, "index": None}
+_cache_lock = threading.Lock()
+
+# Index for the API, reloaded only when the file changes
+def get_similarity_index(path=SIMILARITY_INDEX_PATH):
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    with _cache_lock:
+        if _cache["mtime"] != mtime:
+            _cache["index"] = SimilarityIndex.load(path)
+            _cache["mtime"] = mtime
+        return _cache["index"]
+
+if __name__ == "__main__":
+    from langchain_community.graphs import Neo4jGraph
+
+    graph = Neo4jGraph(url=os.getenv("NEO4J_URI"), username=os.getenv("NEO4J_USERNAME"), password=os.getenv("NEO4J_PASSWORD"))
+    if "--rebuild" in sys.argv or not os.path.exists(SIMILARITY_INDEX_PATH):
+        build_similarity_index(graph)
+    else:
+        update_similarity_index(graph, [variant["variant"] for variant in fetch_variant_specs(graph)])
@@ -0,0 +1,135 @@
+import json
+import re
+
+# Variants (all, or only $names) with brand, model and the properties of each HAS_* spec node, in one query
+VARIANT_SPECS_QUERY = """
+MATCH (b:Brand)-[:HAS_MODEL]->(m:Model)-[:HAS_VARIANT]->(v:Variant)
+WHERE $names IS NULL OR v.name IN $names
+OPTIONAL MATCH (v)-[r]->(s)
+WHERE type(r) STARTS WITH 'HAS_'
+RETURN b.name AS brand, m.name AS model, m.type AS body_type, v.name AS variant,
+       collect({label: labels(s)[0], properties: properties(s)}) AS specs
+"""
+
+# Each variant's specs denormalized by the loader into one JSON property, so a spec sheet is a single read
+SPEC_SHEET_PROPERTY = "spec_sheet"
+
+WRITE_SPEC_SHEETS_QUERY = """
+UNWIND $rows AS row
+MATCH (v:Variant {name: row.name})
+SET v.spec_sheet = row.spec_sheet
+"""
+
+# Index seek on Variant.name, then up to the model and brand; no spec-node traversal
+SPEC_SHEETS_QUERY = """
+MATCH (b:Brand)-[:HAS_MODEL]->(m:Model)-[:HAS_VARIANT]->(v:Variant)
+WHERE v.name IN $names
+RETURN b.name AS brand, m.name AS model, m.type AS body_type, v.name AS variant, v.spec_sheet AS spec_sheet
+"""
+
+YES_VALUES = {"yes", "y", "true", "available", "standard", "present"}
+NO_VALUES = {"no", "n", "false", "not available", "na", "n/a", "-", "none", "absent"}
+NUMBER_PATTERN = re.compile(r"-?\d+(?:\.\d+)?")
+
+# Features and non-dict specs are stored by the loader as a JSON string in `details`
+def _parse_details(value):
+    try:
+        return json.loads(value)
+    except (TypeError, ValueError):
+        return value
+
+# {"Safety": {"Airbags": "6"}} -> {"Safety.Airbags": "6"}
+def flatten_specs(specs):
+    flat = {}
+    for label, properties in specs.items():
+        for key, value in properties.items():
+            if key == "details":
+                details = _parse_details(value)
+                if isinstance(details, dict):
+                    for detail_key, detail_value in details.items():
+                        flat[f"{label}.{detail_key}"] = detail_value
+                elif isinstance(details, list):
+                    for item in details:
+                        flat[f"{label}.{item}"] = "Yes"
+                else:
+                    flat[f"{label}.details"] = details
+            else:
+                flat[f"{label}.{key}"] = value
+    return flat
+
+# True/False for yes/no style values, None for anything else
+def feature_flag(value):
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in YES_VALUES:
+        return True
+    if text in NO_VALUES:
+        return False
+    return None
+
+# First number in a value such as "1498 cc" or "18.41 kmpl"
+def numeric_value(value):
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    match = NUMBER_PATTERN.search(str(value).replace(",", ""))
+    return float(match.group()) if match else None
+
+def variant_price(specs):
+    price = specs.get("Price", {}).get("ex_showroom")
+    return numeric_value(price) if price is not None else None
+
+def fuel_type(specs):
+    for key, value in specs.get("Fuel", {}).items():
+        if "type" in key.lower():
+            return str(value).strip().lower()
+    return None
+
+def _collect_specs(spec_rows):
+    specs = {}
+    for spec in spec_rows:
+        if spec.get("label"):
+            specs.setdefault(spec["label"], {}).update(spec.get("properties") or {})
+    return specs
+
+def _row_to_variant(row, specs=None):
+    if specs is None:
+        specs = _collect_specs(row["specs"])
+    return {
+        "brand": row["brand"],
+        "model": row["model"],
+        "body_type": (row["body_type"] or "unknown").strip().lower(),
+        "variant": row["variant"],
+        "price": variant_price(specs),
+        "fuel": fuel_type(specs),
+        "specs": specs,
+    }
+
+# Variants with parsed specs for the offline precompute jobs; pass names to fetch only those variants
+def fetch_variant_specs(graph, names=None):
+    return [_row_to_variant(row) for row in graph.query(VARIANT_SPECS_QUERY, {"names": names})]
+
+# Rebuild the spec_sheet projection of the given variants from their spec nodes; the loader calls this on every ingest
+def refresh_spec_sheets(graph, names):
+    rows = [
+        {"name": row["variant"], "spec_sheet": json.dumps(_collect_specs(row["specs"]), sort_keys=True, ensure_ascii=False)}
+        for row in graph.query(VARIANT_SPECS_QUERY, {"names": list(names)})
+    ]
+    if rows:
+        graph.query(WRITE_SPEC_SHEETS_QUERY, {"rows": rows})
+    return len(rows)
+
+# Full spec sheets for many variants in one indexed read, keyed by variant name
+def get_spec_sheets(graph, names):
+    names = list(dict.fromkeys(names))
+    sheets, unprojected = {}, []
+    for row in graph.query(SPEC_SHEETS_QUERY, {"names": names}):
+        if row["spec_sheet"] is None:
+            unprojected.append(row["variant"])
+        else:
+            sheets[row["variant"]] = _row_to_variant(row, json.loads(row["spec_sheet"]))
+    # Variants loaded before the projection existed fall back to the spec-node traversal
+    if unprojected:
+        for variant in fetch_variant_specs(graph, unprojected):
+            sheets[variant["variant"]] = variant
+    return {name: sheets[name] for name in names if name in sheets}
@@ -2,19 +2,18 @@ from flask import Flask, request, jsonify
 from flask_cors import CORS
 from dotenv import load_dotenv
 import os
+import sys
+import threading
+import requests
 import warnings
 warnings.filterwarnings("ignore")
-from neo4j import GraphDatabase
-from langchain_community.graphs import Neo4jGraph
-from langchain_experimental.llms.ollama_functions import OllamaFunctions
-from langchain.chains import GraphCypherQAChain
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.pydantic_v1 import BaseModel, Field
-from langchain_core.runnables import RunnablePassthrough
-from langchain_core.output_parsers import PydanticOutputParser
+from functools import lru_cache
 from typing import List
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from entity_resolver import get_resolver
+from llm_client import recorded, CassetteMiss
+
 load_dotenv()
 
 app = Flask(__name__)
@@ -25,17 +24,31 @@ NEO4J_URI = os.getenv("NEO4J_URI")
 NEO4J_USERNAME = os.getenv("NEO4J_USERNAME")
 NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD")
 
+# Ollama connection; keep_alive keeps the model resident between requests
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3-8b")
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+
+# The langchain stack is imported on first use, not at module load, so the server starts without paying for it
+
 # Entities model for structured output
-class Entities(BaseModel):
-    """Identifying information about entities."""
-    names: List[str] = Field(..., description="List of identified entities from the input text.")
+@lru_cache(maxsize=None)
+def entities_model():
+    from langchain_core.pydantic_v1 import BaseModel, Field
 
-    @classmethod
-    def model_construct(cls, **kwargs):
-        """Custom method to create an instance using data."""
-        return cls(**kwargs)
+    class Entities(BaseModel):
+        """Identifying information about entities."""
+        names: List[str] = Field(..., description="List of identified entities from the input text.")
+
+        @classmethod
+        def model_construct(cls, **kwargs):
+            """Custom method to create an instance using data."""
+            return cls(**kwargs)
+
+    return Entities
 
 def graph_connection():
+    from langchain_community.graphs import Neo4jGraph
     try:
         graph = Neo4jGraph(url=NEO4J_URI, username=NEO4J_USERNAME, password=NEO4J_PASSWORD)
         return graph
@@ -45,80 +58,120 @@ def graph_connection():
 
 # Ollama LLM connection
 def llm_connection():
+    from langchain_experimental.llms.ollama_functions import OllamaFunctions
     try:
         llm = OllamaFunctions(
-            model="llama3-8b",
-            endpoint="http://localhost:11434"
+            model=OLLAMA_MODEL,
+            base_url=OLLAMA_BASE_URL,
+            keep_alive=OLLAMA_KEEP_ALIVE
         )
         return llm
     except Exception as e:
         print(f"Error initializing LLM: {e}")
         return None
 
-prompt = ChatPromptTemplate.from_messages([
+entity_messages = [
     ("system", "You are extracting automotive entities like Model, Engine, Variant, etc., from the input."),
     ("human", "Use the given format to extract entities from: {input_text}")
-])
+]
 
 # Function to map entities to nodes in the database based on the schema
-match_query = """
-MATCH (n)
-WHERE n.name CONTAINS $value
-RETURN n.name AS result, labels(n)[0] AS type
-LIMIT 1
-"""
-
+# Resolved from an in-process name index first, then in one full-text query for whatever is left
 def map_to_database(graph, values):
     if not graph:
         return "Graph connection failed."
+    resolved = get_resolver().resolve(graph, values.names)
     result = ""
     for entity in values.names:
-        try:
-            response = graph.query(match_query, {"value": entity})
-            if response:
-                result += f"{entity} maps to {response[0]['result']} {response[0]['type']} in the database.\n"
-        except IndexError:
-            continue
+        if entity in resolved:
+            name, label = resolved[entity]
+            result += f"{entity} maps to {name} {label} in the database.\n"
     return result or "No matching entities found."
 
-def cypher_query_generator(graph, llm, entity_chain, question):
-    cypher_template = """Based on the Neo4j graph schema below, write a Cypher query that would answer the user's question:
+cypher_template = """Based on the Neo4j graph schema below, write a Cypher query that would answer the user's question:
     {schema}
     Entities in the question map to the following database values:
     {entities_list}
     Question: {question}
     Cypher query:"""
 
-    cypher_prompt = ChatPromptTemplate.from_messages([
-        ("system", "Given an input question, convert it to a Cypher query."),
-        ("human", cypher_template)
-    ])
+cypher_messages = [
+    ("system", "Given an input question, convert it to a Cypher query."),
+    ("human", cypher_template)
+]
+
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+# Graph, LLM and chains are built once per process and reused by every request
+def get_pipeline():
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is None:
+            from langchain_core.prompts import ChatPromptTemplate
+            from langchain_core.output_parsers import StrOutputParser, PydanticOutputParser
+
+            graph = graph_connection()
+            llm = llm_connection()
+            if not graph or not llm:
+                return None
+
+            # Chain to extract entities from query
+            output_parser = PydanticOutputParser(pydantic_object=entities_model())
+            _pipeline = {
+                "graph": graph,
+                "schema": graph.schema,
+                "entity_chain": ChatPromptTemplate.from_messages(entity_messages) | llm | output_parser,
+                "cypher_chain": ChatPromptTemplate.from_messages(cypher_messages) | llm.bind(stop=["\nCypherResult:"]) | StrOutputParser(),
+            }
+        return _pipeline
+
+# Load the model into Ollama's memory before the first request; an empty generate request only loads it
+def warmup():
+    pipeline = get_pipeline()
+    if not pipeline:
+        print("Warmup skipped: failed to initialize graph or LLM.")
+        return
+    get_resolver().load(pipeline["graph"])
+    try:
+        response = requests.post(
+            f"{OLLAMA_BASE_URL}/api/generate",
+            json={"model": OLLAMA_MODEL, "keep_alive": OLLAMA_KEEP_ALIVE},
+            timeout=300,
+        )
+        response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        print(f"Error warming up Ollama model: {e}")
 
+def cypher_query_generator(pipeline, question):
+    graph = pipeline["graph"]
     try:
-        entities = entity_chain.invoke({"input_text": question})
+        # Both chain calls go through the cassette store so runs can be recorded and replayed offline
+        entity_names = recorded(
+            "ollama_entities",
+            {"model": OLLAMA_MODEL, "input_text": question},
+            lambda: pipeline["entity_chain"].invoke({"input_text": question}).names,
+        )
+        entities = entities_model()(names=entity_names)
         print("Extracted Entities:", entities)
 
         # Map extracted entities to database nodes
         mapped_entities = map_to_database(graph, entities)
         print("Mapped Entities:", mapped_entities)
 
-        # Retrieve schema from the graph
-        schema = graph.get_schema()
-        print("Graph Schema:", schema)
-
-        # Prepare the prompt with extracted data
+        # Prepare the prompt with extracted data and the schema snapshot taken at startup
         cypher_prompt_data = {
-            "schema": schema,
+            "schema": pipeline["schema"],
             "entities_list": mapped_entities,
             "question": question,
         }
 
         # Pass the data to the LLM for Cypher query generation
-        cypher_response = (
-            cypher_prompt
-            | llm.bind(stop=["\nCypherResult:"])
-            | StrOutputParser()
-        ).invoke(cypher_prompt_data)
+        cypher_response = recorded(
+            "ollama_cypher",
+            {"model": OLLAMA_MODEL, **cypher_prompt_data},
+            lambda: pipeline["cypher_chain"].invoke(cypher_prompt_data),
+        )
 
         print("Generated Cypher Query:", cypher_response)
 
@@ -127,27 +180,27 @@ def cypher_query_generator(graph, llm, entity_chain, question):
 
         return cypher_response
 
+    # A replay miss must reach the client instead of looking like a failed generation
+    except CassetteMiss:
+        raise
     except Exception as e:
         print(f"Error generating Cypher query: {e}")
         return None
 
 # Main function
 def main(query):
-    graph = graph_connection()
-    llm = llm_connection()
-    
-    if not graph or not llm:
+    pipeline = get_pipeline()
+    if not pipeline:
         return "Failed to initialize graph or LLM."
-
-    # Chain to extract entities from query
-    output_parser = PydanticOutputParser(pydantic_object=Entities)
-    entity_chain = prompt | llm | output_parser
+    graph = pipeline["graph"]
 
     # Generate the Cypher query based on user input and schema mapping
     try:
-        cypher_response = cypher_query_generator(graph, llm, entity_chain, query)
+        cypher_response = cypher_query_generator(pipeline, query)
         if not cypher_response:
             return "Cypher query generation failed."
+    except CassetteMiss as e:
+        return str(e)
     except Exception as e:
         print(f"Error during Cypher query generation: {e}")
         return f"Error during Cypher query generation: {e}"
@@ -177,4 +230,6 @@ def ask():
     return jsonify({"answer": answer})
 
 if __name__ == "__main__":
+    # Build the pipeline, load the entity name index and the model before serving the first request
+    warmup()
     app.run(host='0.0.0.0', port=5000)
\ No newline at end of file
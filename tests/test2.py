@@ -2,9 +2,15 @@ from flask import Flask, request, jsonify
 from flask_cors import CORS
 from dotenv import load_dotenv
 import os
-import requests
+import sys
+from itertools import islice
 from neo4j import GraphDatabase
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from result_paging import clamp_page_size, encode_cursor, decode_cursor, InvalidCursor
+from query_guard import page_window
+from llm_client import post_json, CassetteMiss
+
 load_dotenv()
 
 app = Flask(__name__)
@@ -59,6 +65,17 @@ class Neo4jHandler:
         with self.driver.session() as session:
             return [record.data() for record in session.run(cypher_query)]
 
+    # Pull one page of records, with SKIP/LIMIT pushed to the server; returns the page and whether more rows follow
+    def query_page(self, cypher_query, offset=0, page_size=50):
+        window = page_window(cypher_query, {}, offset, page_size)
+        if window is None:
+            return [], False
+        cypher_query, params, skip = window
+        with self.driver.session(fetch_size=page_size + 1) as session:
+            result = session.run(cypher_query, params)
+            records = [record.data() for record in islice(result, skip, skip + page_size + 1)]
+            return records[:page_size], len(records) > page_size
+
     def close(self):
         self.driver.close()
 
@@ -71,10 +88,6 @@ def connect_to_neo4j():
 
 def query_groq(schema, question):
     try:
-        headers = {
-            "Authorization": f"Bearer {GROQ_API_KEY}",
-            "Content-Type": "application/json",
-        }
         payload = {
             "model": "llama3-8b-8192",
             "messages": [
@@ -84,14 +97,12 @@ def query_groq(schema, question):
             "max_tokens": 100
         }
         print("Groq API Payload:", payload)
-        response = requests.post(GROQ_API_ENDPOINT, headers=headers, json=payload)
-
-        if response.status_code == 200:
-            response_data = response.json()
-            print("Groq API Response:", response_data)
-            return response_data["choices"][0]["message"]["content"].strip()
-        else:
-            raise Exception(f"Error from Groq API: {response.status_code} {response.text}")
+        response_data = post_json(payload, kind="chat")
+        print("Groq API Response:", response_data)
+        return response_data["choices"][0]["message"]["content"].strip()
+    # A replay miss must reach the client instead of looking like a failed generation
+    except CassetteMiss:
+        raise
     except Exception as e:
         print(f"Error querying Groq API: {e}")
         return None
@@ -105,12 +116,19 @@ def generate_cypher_query(handler, question):
         
         cypher_query = query_groq(schema, question)
         return cypher_query
+    except CassetteMiss:
+        raise
     except Exception as e:
         print(f"Error generating Cypher query: {e}")
         return None
 
+def run_page(handler, cypher_query, offset, page_size):
+    result, has_more = handler.query_page(cypher_query, offset, page_size)
+    next_cursor = encode_cursor(cypher_query, {}, offset + len(result)) if has_more else None
+    return {"query": cypher_query, "result": result, "page_size": page_size, "next_cursor": next_cursor}
+
 # Main function
-def handle_query(question):
+def handle_query(question, page_size):
     handler = connect_to_neo4j()
     if not handler:
         return "Failed to connect to Neo4j."
@@ -120,8 +138,24 @@ def handle_query(question):
         if not cypher_query:
             return "Failed to generate Cypher query."
 
-        result = handler.query(cypher_query)
-        return {"query": cypher_query, "result": result}
+        return run_page(handler, cypher_query, 0, page_size)
+    except CassetteMiss as e:
+        return str(e)
+    except Exception as e:
+        print(f"Error executing Cypher query: {e}")
+        return "Error executing Cypher query."
+    finally:
+        handler.close()
+
+# Later pages reuse the query carried by the cursor
+def fetch_page(cursor, page_size):
+    cypher_query, _, offset = decode_cursor(cursor)
+    handler = connect_to_neo4j()
+    if not handler:
+        return "Failed to connect to Neo4j."
+
+    try:
+        return run_page(handler, cypher_query, offset, page_size)
     except Exception as e:
         print(f"Error executing Cypher query: {e}")
         return "Error executing Cypher query."
@@ -136,11 +170,18 @@ def home():
 @app.route('/ask', methods=['POST'])
 def ask():
     data = request.json
+    page_size = clamp_page_size(data.get("page_size"))
+    if data.get("cursor"):
+        try:
+            return jsonify({"answer": fetch_page(data["cursor"], page_size)})
+        except InvalidCursor as e:
+            return jsonify({"error": str(e)}), 400
+
     question = data.get("query")
     if not question:
         return jsonify({"error": "Query is required"}), 400
 
-    response = handle_query(question)
+    response = handle_query(question, page_size)
     return jsonify({"answer": response})
 
 if __name__ == "__main__":